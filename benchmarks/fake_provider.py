@@ -0,0 +1,238 @@
+import gzip
+import json
+import math
+import os
+import re
+import subprocess
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Host name used in every URL the fake provider hands out. main.py reaches it through the fake provider acting as
+# an HTTP proxy, so the name never has to resolve and Github/Bitbucket's api. prefix works without any DNS setup.
+PROVIDER_HOST = "provider.bench"
+# Rate limit budget advertised on every API response, large enough to never throttle a benchmark run
+RATE_LIMIT = 100000
+
+class FakeProviderServer(ThreadingHTTPServer):
+    """
+    Serves the repository listing APIs of Github, Azure DevOps, Gitlab and Bitbucket for one organization, their archive
+    downloads, and git's smart HTTP protocol for cloning, all from the bare repositories generated by synthetic_repos.py. \n
+    Every API response is delayed by api_latency_seconds to model the round trip to a real provider.
+    """
+    daemon_threads = True
+
+    def __init__(self, organization: str, repos: list, page_size: int, api_latency_seconds: float):
+        super().__init__(("127.0.0.1", 0), FakeProviderHandler)
+        self.organization = organization
+        self.repos = repos
+        self.repos_by_name = {repo["name"]: repo for repo in repos}
+        self.page_size = page_size
+        self.api_latency_seconds = api_latency_seconds
+        self.api_requests = 0
+        self.git_requests = 0
+        self.lock = threading.Lock()
+
+    def get_project(self, repo_index: int) -> str:
+        return f"project{repo_index % 3}"
+
+class FakeProviderHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        query = {name: values[0] for name, values in urllib.parse.parse_qs(url.query).items()}
+        if url.path.endswith("/info/refs"):
+            return self.serve_git_advertisement(url.path.removesuffix("/info/refs"), query.get("service"))
+        for pattern, handler in API_ROUTES:
+            match = re.fullmatch(pattern, url.path)
+            if match:
+                with self.server.lock:
+                    self.server.api_requests += 1
+                time.sleep(self.server.api_latency_seconds)
+                return handler(self, query, *match.groups())
+        self.send_body(404, b"Not Found", "text/plain")
+
+    def do_POST(self):
+        url = urllib.parse.urlparse(self.path)
+        if url.path.endswith("/git-upload-pack"):
+            return self.serve_git_upload_pack(url.path.removesuffix("/git-upload-pack"))
+        self.send_body(404, b"Not Found", "text/plain")
+
+    def send_body(self, status_code: int, body: bytes, content_type: str, headers: dict = None):
+        self.send_response(status_code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, payload, headers: dict = None):
+        rate_limit_headers = {"X-RateLimit-Limit": str(RATE_LIMIT), "X-RateLimit-Remaining": str(RATE_LIMIT - 1), "X-RateLimit-Reset": str(int(time.time()) + 3600)}
+        self.send_body(200, json.dumps(payload).encode(), "application/json", {**rate_limit_headers, **(headers or {})})
+
+    def get_page(self, query: dict, page_size_parameter: str, page_size_cap: int = None) -> tuple:
+        """
+        Returns (page_num, page_count, repos) for the requested page, honoring the client's page size up to page_size_cap
+        """
+        page_size = int(query.get(page_size_parameter, self.server.page_size))
+        if page_size_cap:
+            page_size = min(page_size, page_size_cap)
+        page_num = max(1, int(query.get("page", 1)))
+        page_count = max(1, math.ceil(len(self.server.repos) / page_size))
+        start = (page_num - 1) * page_size
+        return page_num, page_count, list(enumerate(self.server.repos))[start:start + page_size]
+
+    def find_repo(self, git_path: str) -> dict:
+        # clone urls end in /<name>.git (Github, Gitlab, Bitbucket) or /_git/<name> (Azure DevOps)
+        name = git_path.rstrip("/").rsplit("/", 1)[-1].removesuffix(".git")
+        return self.server.repos_by_name.get(name)
+
+    def serve_github_repos(self, query: dict, organization: str):
+        page_num, page_count, page = self.get_page(query, "per_page", self.server.page_size)
+        base_url = f"http://api.{PROVIDER_HOST}/orgs/{organization}/repos?per_page={query.get('per_page', self.server.page_size)}"
+        links = [f'<{base_url}&page={page_count}>; rel="last"']
+        if page_num < page_count:
+            links.append(f'<{base_url}&page={page_num + 1}>; rel="next"')
+        self.send_json([{
+            "name": repo["name"],
+            "default_branch": "main",
+            "size": repo["size_bytes"] // 1024,
+            "clone_url": f"http://{PROVIDER_HOST}/{organization}/{repo['name']}.git",
+            "url": f"http://api.{PROVIDER_HOST}/repos/{organization}/{repo['name']}",
+        } for _, repo in page], {"Link": ", ".join(links)})
+
+    def serve_azure_devops_repos(self, query: dict, organization: str):
+        # Azure DevOps pages with an opaque continuation token, here simply the next page number
+        page_num = int(query.get("continuationToken", 1))
+        page_count = max(1, math.ceil(len(self.server.repos) / self.server.page_size))
+        start = (page_num - 1) * self.server.page_size
+        repos = list(enumerate(self.server.repos))[start:start + self.server.page_size]
+        payload = {"count": len(repos), "value": [{
+            "name": repo["name"],
+            "defaultBranch": "refs/heads/main",
+            "size": repo["size_bytes"],
+            "project": {"name": self.server.get_project(index)},
+            "webUrl": f"http://{PROVIDER_HOST}/{organization}/{self.server.get_project(index)}/_git/{repo['name']}",
+            "url": f"http://{PROVIDER_HOST}/{organization}/{self.server.get_project(index)}/_apis/git/repositories/{repo['name']}",
+        } for index, repo in repos]}
+        if page_num < page_count:
+            payload["continuationToken"] = str(page_num + 1)
+        self.send_json(payload)
+
+    def serve_gitlab_projects(self, query: dict, organization: str):
+        page_num, page_count, page = self.get_page(query, "per_page", self.server.page_size)
+        headers = {"X-Total-Pages": str(page_count)}
+        if page_num < page_count:
+            headers["X-Next-Page"] = str(page_num + 1)
+        self.send_json([{
+            "id": index,
+            "path": repo["name"],
+            "default_branch": "main",
+            "namespace": {"full_path": organization},
+            "statistics": {"repository_size": repo["size_bytes"]},
+            "http_url_to_repo": f"http://{PROVIDER_HOST}/{organization}/{repo['name']}.git",
+        } for index, repo in page], headers)
+
+    def serve_bitbucket_repos(self, query: dict, organization: str):
+        # main.py derives the page count from size and its own pagelen, so the requested pagelen is always honored
+        page_num, page_count, page = self.get_page(query, "pagelen")
+        payload = {"size": len(self.server.repos), "page": page_num, "values": [{
+            "slug": repo["name"],
+            "mainbranch": {"name": "main"},
+            "size": repo["size_bytes"],
+            "project": {"name": self.server.get_project(index)},
+            "links": {
+                "clone": [{"name": "https", "href": f"http://x-token-auth@{PROVIDER_HOST}/{organization}/{repo['name']}.git"}],
+                "html": {"href": f"http://{PROVIDER_HOST}/{organization}/{repo['name']}"},
+            },
+        } for index, repo in page]}
+        if page_num < page_count:
+            payload["next"] = f"http://api.{PROVIDER_HOST}/2.0/repositories/{organization}?pagelen={query.get('pagelen', self.server.page_size)}&page={page_num + 1}"
+        self.send_json(payload)
+
+    def serve_archive(self, repo: dict, archive_format: str):
+        if repo is None:
+            return self.send_body(404, b"Not Found", "text/plain")
+        command = ["git", "--git-dir", repo["bare_repo_path"], "archive", f"--format={archive_format}"]
+        if archive_format != "zip":
+            # tarballs wrap the tree in a single top level folder like the real providers do
+            command.append(f"--prefix={repo['name']}-main/")
+        body = subprocess.run(command + ["main"], capture_output=True, check=True).stdout
+        self.send_body(200, body, "application/zip" if archive_format == "zip" else "application/gzip")
+
+    def serve_name_archive(self, query: dict, *path_parts):
+        # the repository name is always the last captured part of the archive routes
+        return self.serve_archive(self.server.repos_by_name.get(path_parts[-1]), "zip" if query.get("$format") == "zip" else "tar.gz")
+
+    def serve_gitlab_archive(self, query: dict, project_id: str):
+        repos = self.server.repos
+        index = int(project_id)
+        return self.serve_archive(repos[index] if 0 <= index < len(repos) else None, "tar.gz")
+
+    def serve_git_advertisement(self, git_path: str, service: str):
+        repo = self.find_repo(git_path)
+        if repo is None or service != "git-upload-pack":
+            return self.send_body(404, b"Not Found", "text/plain")
+        with self.server.lock:
+            self.server.git_requests += 1
+        git_protocol = self.headers.get("Git-Protocol", "")
+        output = subprocess.run(["git", "upload-pack", "--stateless-rpc", "--advertise-refs", repo["bare_repo_path"]],
+                                capture_output=True, check=True, env={**os.environ, "GIT_PROTOCOL": git_protocol}).stdout
+        # protocol v0 expects the service announcement that git http-backend prepends; v2 does not
+        if "version=2" not in git_protocol:
+            output = b"001e# service=git-upload-pack\n0000" + output
+        self.send_body(200, output, "application/x-git-upload-pack-advertisement", {"Cache-Control": "no-cache"})
+
+    def read_request_body(self) -> bytes:
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                chunk_size = int(self.rfile.readline().split(b";")[0].strip(), 16)
+                if chunk_size == 0:
+                    self.rfile.readline()
+                    break
+                chunks.append(self.rfile.read(chunk_size))
+                self.rfile.readline()
+            body = b"".join(chunks)
+        else:
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.headers.get("Content-Encoding", "").lower() == "gzip":
+            body = gzip.decompress(body)
+        return body
+
+    def serve_git_upload_pack(self, git_path: str):
+        body = self.read_request_body()
+        repo = self.find_repo(git_path)
+        if repo is None:
+            return self.send_body(404, b"Not Found", "text/plain")
+        with self.server.lock:
+            self.server.git_requests += 1
+        output = subprocess.run(["git", "upload-pack", "--stateless-rpc", repo["bare_repo_path"]], input=body,
+                                capture_output=True, check=True, env={**os.environ, "GIT_PROTOCOL": self.headers.get("Git-Protocol", "")}).stdout
+        self.send_body(200, output, "application/x-git-upload-pack-result", {"Cache-Control": "no-cache"})
+
+# Path pattern -> handler of every API and archive endpoint, matched against the full path
+API_ROUTES = [
+    (r"/orgs/([^/]+)/repos", FakeProviderHandler.serve_github_repos),
+    (r"/repos/[^/]+/([^/]+)/tarball/[^/]*", FakeProviderHandler.serve_name_archive),
+    (r"/([^/]+)/_apis/git/repositories", FakeProviderHandler.serve_azure_devops_repos),
+    (r"/[^/]+/[^/]+/_apis/git/repositories/([^/]+)/items", FakeProviderHandler.serve_name_archive),
+    (r"/api/v4/groups/([^/]+)/projects", FakeProviderHandler.serve_gitlab_projects),
+    (r"/api/v4/projects/(\d+)/repository/archive\.tar\.gz", FakeProviderHandler.serve_gitlab_archive),
+    (r"/2\.0/repositories/([^/]+)", FakeProviderHandler.serve_bitbucket_repos),
+    (r"/[^/]+/([^/]+)/get/[^/]*\.tar\.gz", FakeProviderHandler.serve_name_archive),
+]
+
+def start_fake_provider(organization: str, repos: list, page_size: int, api_latency_seconds: float) -> FakeProviderServer:
+    """
+    Starts the fake provider on a free local port in a background thread. Call shutdown() on the result to stop it.
+    """
+    server = FakeProviderServer(organization, repos, page_size, api_latency_seconds)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
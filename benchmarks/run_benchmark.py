@@ -0,0 +1,174 @@
+import argparse
+import json
+import os
+import platform
+import shlex
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+from fake_provider import PROVIDER_HOST, start_fake_provider
+from synthetic_repos import generate_org
+
+parser = argparse.ArgumentParser(description='Benchmarks main.py end to end against a local fake DevOps provider serving synthetic repositories. Runs fully offline.')
+
+# Add arguments
+parser.add_argument('--providers', type=str, help="Comma separated DevOps platforms to benchmark. Default is 'GitHub,AzureDevOps,GitLab,Bitbucket'", required=False, default='GitHub,AzureDevOps,GitLab,Bitbucket')
+parser.add_argument('--repos', type=int, help='Number of repositories in the synthetic organization. Default is 20', required=False, default=20)
+parser.add_argument('--files_per_repo', type=int, help='Number of source files per repository. Default is 200', required=False, default=200)
+parser.add_argument('--mean_file_lines', type=int, help='Mean number of code lines per file. Default is 100', required=False, default=100)
+parser.add_argument('--size_distribution', type=str, choices=['uniform', 'lognormal'], help="Distribution of file sizes. 'lognormal' has a long tail of large files like real code bases. Default is 'lognormal'", required=False, default='lognormal')
+parser.add_argument('--language_mix', type=str, help="Relative weights of the generated languages by extension. Default is 'py=3,js=3,java=2,go=1,c=1'", required=False, default='py=3,js=3,java=2,go=1,c=1')
+parser.add_argument('--depth', type=int, help='Maximum directory nesting of the generated files. Default is 3', required=False, default=3)
+parser.add_argument('--seed', type=int, help='Seed of the fixture generator. Default is 1', required=False, default=1)
+parser.add_argument('--page_size', type=int, help='Repositories per page of the fake listing APIs. Default is 10', required=False, default=10)
+parser.add_argument('--api_latency_ms', type=float, help='Delay added to every fake API response to model the round trip to a real provider. Default is 50', required=False, default=50)
+parser.add_argument('--main_args', type=str, help="Extra arguments for main.py, e.g. --main_args='--engine builtin --workers 4'. Default is '--engine builtin'", required=False, default='--engine builtin')
+parser.add_argument('--repeat', type=int, help='Number of runs per provider. The median is reported and compared. Default is 3', required=False, default=3)
+parser.add_argument('--work_dir', type=str, help="Directory for the fixtures and the working directories of the runs. Fixtures are reused while the shape does not change. Default is '.benchmark'", required=False, default='.benchmark')
+parser.add_argument('--output', type=str, help="Path of the JSON results file. Default is 'benchmark-results.json'", required=False, default='benchmark-results.json')
+parser.add_argument('--baseline', type=str, help='Results file of a previous run to compare against. The exit code is 1 if any median regressed by more than --tolerance', required=False)
+parser.add_argument('--tolerance', type=float, help='Allowed relative slowdown against --baseline before it counts as a regression. Default is 0.1 (10%%)', required=False, default=0.1)
+
+# Parse the arguments
+args = parser.parse_args()
+
+organization = "bench"
+path_to_main = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")
+# Timings below this many seconds are too noisy to call a regression
+NOISE_FLOOR_SECONDS = 0.05
+# Stages reported per run: run level stages come from run_stages, per repository stages are summed over all repositories
+RUN_STAGES = ["discovery_page", "aggregate"]
+REPO_STAGES = ["cache_lookup", "scratch_wait", "fetch", "count", "cleanup"]
+
+def summarize_run(profile: dict) -> dict:
+    """
+    Extracts the stage timings and counters of a run-profile.json written by main.py
+    """
+    stages = {}
+    for name in RUN_STAGES:
+        if name in profile["run_stages"]:
+            stages[name] = profile["run_stages"][name]["total"]
+    for name in REPO_STAGES:
+        if name in profile["repo_stage_seconds"]:
+            stages[name] = profile["repo_stage_seconds"][name]["total"]
+            stages[f"{name}_p95"] = profile["repo_stage_seconds"][name]["p95"]
+    counters = {name: summary["total"] for name, summary in profile["repo_counters"].items() if name in ("fetch_bytes", "files_fetched", "files_counted")}
+    return {"stages": stages, "counters": counters, "total_loc": profile["total_loc"], "repos_completed": profile["repos_completed"]}
+
+def run_main(provider: str, run_dir: str, proxy_url: str) -> dict:
+    """
+    Runs main.py once for provider in a fresh working directory and returns its timings
+    """
+    shutil.rmtree(run_dir, ignore_errors=True)
+    os.makedirs(run_dir)
+    command = [sys.executable, path_to_main, "--organization", organization, "--access_token", "benchmark", "--use_http",
+               "--devops_base_url_override", PROVIDER_HOST, "--devops", provider] + shlex.split(args.main_args)
+    # requests and git both send every request through the fake provider, so the fake host names never have to resolve
+    environment = {**os.environ, "http_proxy": proxy_url, "HTTP_PROXY": proxy_url, "no_proxy": "", "NO_PROXY": "", "GIT_TERMINAL_PROMPT": "0"}
+    start_time = time.perf_counter()
+    with open(os.path.join(run_dir, "main.log"), "w") as log_file:
+        exit_code = subprocess.run(command, cwd=run_dir, env=environment, stdout=log_file, stderr=subprocess.STDOUT).returncode
+    wall_seconds = time.perf_counter() - start_time
+    profile_path = os.path.join(run_dir, "output", "run-profile.json")
+    if exit_code != 0 or not os.path.exists(profile_path):
+        print(f"Error: main.py exited with {exit_code} for {provider}. See {os.path.join(run_dir, 'main.log')}")
+        return {"exit_code": exit_code, "wall_seconds": round(wall_seconds, 3)}
+    with open(profile_path, "r") as f:
+        profile = json.load(f)
+    return {"exit_code": exit_code, "wall_seconds": round(wall_seconds, 3), **summarize_run(profile)}
+
+def summarize_provider(provider: str, runs: list, expected_loc: int) -> dict:
+    successful_runs = [run for run in runs if run["exit_code"] == 0]
+    result = {"provider": provider, "runs": runs, "successful_runs": len(successful_runs), "expected_loc": expected_loc}
+    if not successful_runs:
+        return result
+    result["median_wall_seconds"] = round(statistics.median(run["wall_seconds"] for run in successful_runs), 3)
+    stage_names = {name for run in successful_runs for name in run["stages"]}
+    result["median_stages"] = {name: round(statistics.median(run["stages"].get(name, 0.0) for run in successful_runs), 3) for name in sorted(stage_names)}
+    result["total_loc"] = successful_runs[-1]["total_loc"]
+    # the fixtures are generated with known counts; the builtin engine is expected to match them exactly
+    result["loc_matches_expected"] = all(run["total_loc"] == expected_loc for run in successful_runs)
+    return result
+
+def compare_to_baseline(results: list, baseline: dict) -> list:
+    """
+    Prints the change of every median against the baseline and returns the regressions
+    """
+    baseline_results = {result["provider"]: result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        baseline_result = baseline_results.get(result["provider"])
+        if baseline_result is None or "median_wall_seconds" not in result or "median_wall_seconds" not in baseline_result:
+            continue
+        metrics = {"wall_seconds": (baseline_result["median_wall_seconds"], result["median_wall_seconds"])}
+        for name, seconds in result["median_stages"].items():
+            if name in baseline_result["median_stages"]:
+                metrics[name] = (baseline_result["median_stages"][name], seconds)
+        for name, (baseline_seconds, seconds) in metrics.items():
+            change = (seconds - baseline_seconds) / baseline_seconds if baseline_seconds > 0 else 0.0
+            regressed = change > args.tolerance and seconds - baseline_seconds > NOISE_FLOOR_SECONDS
+            print(f"{result['provider']:<12} {name:<18} {baseline_seconds:>10.3f}s -> {seconds:>10.3f}s {change:>+8.1%}{'  REGRESSION' if regressed else ''}")
+            if regressed:
+                regressions.append({"provider": result["provider"], "metric": name, "baseline_seconds": baseline_seconds, "seconds": seconds, "change": round(change, 4)})
+    return regressions
+
+shape = {
+    "repos": args.repos,
+    "files_per_repo": args.files_per_repo,
+    "mean_file_lines": args.mean_file_lines,
+    "size_distribution": args.size_distribution,
+    "language_mix": args.language_mix,
+    "depth": args.depth,
+    "seed": args.seed,
+}
+fixture_start_time = time.perf_counter()
+repos = generate_org(os.path.join(args.work_dir, "fixtures"), shape)
+print(f"Fixtures ready in {time.perf_counter() - fixture_start_time:.1f}s")
+expected_loc = sum(repo["code"] for repo in repos)
+
+server = start_fake_provider(organization, repos, args.page_size, args.api_latency_ms / 1000)
+proxy_url = f"http://127.0.0.1:{server.server_address[1]}"
+results = []
+try:
+    for provider in args.providers.split(","):
+        runs = []
+        for run_index in range(1, args.repeat + 1):
+            print(f"Running {provider} {run_index}/{args.repeat}")
+            runs.append(run_main(provider, os.path.join(args.work_dir, "runs", provider), proxy_url))
+        result = summarize_provider(provider, runs, expected_loc)
+        results.append(result)
+        print(f"{provider}: median {result.get('median_wall_seconds')}s, LOC {result.get('total_loc')} (expected {expected_loc})")
+finally:
+    server.shutdown()
+
+output = {
+    "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    "environment": {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "git": subprocess.run(["git", "--version"], capture_output=True, text=True).stdout.strip(),
+    },
+    "shape": shape,
+    "page_size": args.page_size,
+    "api_latency_ms": args.api_latency_ms,
+    "main_args": args.main_args,
+    "expected_loc": expected_loc,
+    "results": results,
+}
+regressions = []
+if args.baseline:
+    with open(args.baseline, "r") as f:
+        regressions = compare_to_baseline(results, json.load(f))
+    output["regressions"] = regressions
+with open(args.output, "w") as f:
+    json.dump(output, f, indent=4)
+print(f"Benchmark results written to {args.output}")
+
+failed = [result["provider"] for result in results if result["successful_runs"] < args.repeat]
+if failed:
+    print(f"Runs failed for: {', '.join(failed)}")
+if failed or regressions:
+    exit(1)
@@ -0,0 +1,133 @@
+import json
+import math
+import os
+import random
+import shutil
+import subprocess
+
+# Line comment prefix and a code line template for every language the generator can write
+LANGUAGE_TEMPLATES = {
+    ".py": ("#", "value_{index} = {index}"),
+    ".js": ("//", "var value{index} = {index};"),
+    ".ts": ("//", "let value{index}: number = {index};"),
+    ".java": ("//", "int value{index} = {index};"),
+    ".go": ("//", "var value{index} = {index}"),
+    ".c": ("//", "int value{index} = {index};"),
+    ".rb": ("#", "value_{index} = {index}"),
+    ".cs": ("//", "int value{index} = {index};"),
+}
+# Bumped whenever the generated fixtures or their description change, so fixtures of older versions are regenerated
+FIXTURE_VERSION = 2
+# A blank line is written after every this many code lines
+BLANK_LINE_INTERVAL = 10
+# Number of distinct directory names per level of nesting
+DIRECTORY_FAN_OUT = 4
+# Fixed identity and dates, so the same shape and seed always produce the same commits
+GIT_ENVIRONMENT = {
+    "GIT_AUTHOR_NAME": "benchmark",
+    "GIT_AUTHOR_EMAIL": "benchmark@example.com",
+    "GIT_AUTHOR_DATE": "2024-01-01T00:00:00Z",
+    "GIT_COMMITTER_NAME": "benchmark",
+    "GIT_COMMITTER_EMAIL": "benchmark@example.com",
+    "GIT_COMMITTER_DATE": "2024-01-01T00:00:00Z",
+}
+
+def parse_language_mix(language_mix: str) -> dict:
+    """
+    Parses a language mix like 'py=3,js=2,java=1' into extension -> weight
+    """
+    weights = {}
+    for item in language_mix.split(","):
+        extension, _, weight = item.strip().partition("=")
+        extension = extension if extension.startswith(".") else f".{extension}"
+        if extension not in LANGUAGE_TEMPLATES:
+            raise ValueError(f"Unsupported language {extension}. Supported: {', '.join(sorted(LANGUAGE_TEMPLATES))}")
+        weights[extension] = float(weight or 1)
+    return weights
+
+def pick_line_count(rng: random.Random, mean_file_lines: int, size_distribution: str) -> int:
+    """
+    Returns the number of code lines of a file. 'lognormal' gives the long tail of a real code base, with a few very large files.
+    """
+    if size_distribution == "uniform":
+        return rng.randint(1, max(1, 2 * mean_file_lines - 1))
+    sigma = 1.0
+    return max(1, int(rng.lognormvariate(math.log(mean_file_lines) - sigma * sigma / 2, sigma)))
+
+def write_source_file(file_path: str, extension: str, code_lines: int) -> dict:
+    """
+    Writes a file with one comment line, code_lines code lines and a blank line every BLANK_LINE_INTERVAL code lines. \n
+    Returns its expected counts.
+    """
+    comment_prefix, code_template = LANGUAGE_TEMPLATES[extension]
+    lines = [f"{comment_prefix} generated by benchmarks/synthetic_repos.py"]
+    blank_lines = 0
+    for index in range(1, code_lines + 1):
+        lines.append(code_template.format(index=index))
+        if index % BLANK_LINE_INTERVAL == 0:
+            lines.append("")
+            blank_lines += 1
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, "w", newline="\n") as f:
+        f.write("\n".join(lines) + "\n")
+    return {"blank": blank_lines, "comment": 1, "code": code_lines}
+
+def run_git(arguments: list, cwd: str = None):
+    subprocess.run(["git"] + arguments, cwd=cwd, check=True, capture_output=True, env={**os.environ, **GIT_ENVIRONMENT})
+
+def generate_repo(bare_repo_path: str, seed: int, file_count: int, mean_file_lines: int, size_distribution: str, language_mix: dict, depth: int) -> dict:
+    """
+    Generates a bare git repository with a single commit on main. \n
+    Returns a description of the repository including its expected line counts.
+    """
+    rng = random.Random(seed)
+    work_tree = f"{bare_repo_path}.work"
+    shutil.rmtree(work_tree, ignore_errors=True)
+    extensions = list(language_mix)
+    weights = [language_mix[extension] for extension in extensions]
+    totals = {"files": 0, "blank": 0, "comment": 0, "code": 0}
+    for file_index in range(file_count):
+        extension = rng.choices(extensions, weights)[0]
+        directories = [f"module{rng.randrange(DIRECTORY_FAN_OUT)}" for _ in range(rng.randint(0, depth))]
+        file_path = os.path.join(work_tree, *directories, f"file{file_index}{extension}")
+        counts = write_source_file(file_path, extension, pick_line_count(rng, mean_file_lines, size_distribution))
+        totals["files"] += 1
+        for column, value in counts.items():
+            totals[column] += value
+    run_git(["init", "--quiet", "--initial-branch=main", work_tree])
+    run_git(["add", "--all"], work_tree)
+    run_git(["commit", "--quiet", "--message", "Synthetic benchmark fixture"], work_tree)
+    shutil.rmtree(bare_repo_path, ignore_errors=True)
+    run_git(["clone", "--quiet", "--bare", work_tree, bare_repo_path])
+    # --fetch_mode partial needs the server to accept object filters
+    run_git(["config", "uploadpack.allowFilter", "true"], bare_repo_path)
+    shutil.rmtree(work_tree)
+    # reported by the fake provider like the repository size fields of the real APIs
+    size_bytes = sum(os.path.getsize(os.path.join(directory_path, file_name)) for directory_path, _, file_names in os.walk(bare_repo_path) for file_name in file_names)
+    return {"bare_repo_path": bare_repo_path, "size_bytes": size_bytes, **totals}
+
+def generate_org(fixture_dir: str, shape: dict) -> list:
+    """
+    Generates shape["repos"] bare repositories under fixture_dir, reusing them when a previous run generated the same shape. \n
+    Returns the description of every repository.
+    """
+    manifest_path = os.path.join(fixture_dir, "fixtures.json")
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r") as f:
+            manifest = json.load(f)
+        if manifest.get("version") == FIXTURE_VERSION and manifest["shape"] == shape:
+            print(f"Reusing fixtures in {fixture_dir}")
+            return manifest["repos"]
+    shutil.rmtree(fixture_dir, ignore_errors=True)
+    os.makedirs(fixture_dir)
+    language_mix = parse_language_mix(shape["language_mix"])
+    repos = []
+    for repo_index in range(shape["repos"]):
+        name = f"repo{repo_index}"
+        print(f"Generating {name} ({shape['files_per_repo']} files)")
+        repo = generate_repo(os.path.join(fixture_dir, f"{name}.git"), shape["seed"] * 100003 + repo_index, shape["files_per_repo"],
+                             shape["mean_file_lines"], shape["size_distribution"], language_mix, shape["depth"])
+        repos.append({"name": name, **repo})
+    with open(manifest_path, "w") as f:
+        json.dump({"version": FIXTURE_VERSION, "shape": shape, "repos": repos}, f, indent=4)
+    return repos
@@ -0,0 +1,165 @@
+import hashlib
+import itertools
+import os
+import sqlite3
+import subprocess
+import threading
+
+# SQLite limits the number of parameters in a single statement, so lookups are batched
+LOOKUP_BATCH_SIZE = 500
+READ_BUFFER_SIZE = 1024 * 1024
+
+def hash_blob(file_path: str) -> str:
+    """
+    Returns the git blob SHA of a file, i.e. the SHA git would store for it, without needing a repository
+    """
+    blob_hash = hashlib.sha1(f"blob {os.path.getsize(file_path)}\0".encode())
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(READ_BUFFER_SIZE), b""):
+            blob_hash.update(chunk)
+    return blob_hash.hexdigest()
+
+def read_git_blob_shas(repo_path: str) -> dict:
+    """
+    Returns relative path -> blob SHA for every file in the index of a git working tree, or an empty dict if
+    repo_path is not a git working tree. Reading the index is much cheaper than hashing every file.
+    """
+    if not os.path.isdir(os.path.join(repo_path, ".git")):
+        return {}
+    try:
+        result = subprocess.run(["git", "-C", repo_path, "ls-files", "-s", "-z"], capture_output=True, check=True)
+    except (subprocess.CalledProcessError, OSError):
+        return {}
+    blob_shas = {}
+    # each entry looks like: <mode> <sha> <stage>\t<path>
+    for entry in result.stdout.split(b"\0"):
+        if not entry:
+            continue
+        info, _, path = entry.partition(b"\t")
+        blob_shas[os.path.normpath(path.decode("utf-8", "surrogateescape"))] = info.split()[1].decode()
+    return blob_shas
+
+class BlobIndex:
+    """
+    Content addressed index of line counts, persisted in SQLite across repositories and runs. \n
+    Maps a git blob SHA and language to the counts of that content, so an identical file in a fork or a
+    vendored copy is looked up instead of read again. Also tracks the unique lines of code of the current run,
+    counting every distinct blob once. An index shared by several scans (see start_scan) tracks them per scan.
+    """
+    def __init__(self, index_file_path: str):
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(index_file_path, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS blobs (blob_sha TEXT NOT NULL, language TEXT NOT NULL, blank INTEGER NOT NULL, comment INTEGER NOT NULL, code INTEGER NOT NULL, PRIMARY KEY (blob_sha, language))")
+        # scan_key 0 is the run of a process that does not call start_scan, e.g. cloc.py
+        self.connection.execute("CREATE TEMP TABLE run_blobs (scan_key INTEGER NOT NULL, blob_sha TEXT NOT NULL, PRIMARY KEY (scan_key, blob_sha))")
+        self.scan_keys = itertools.count(1)
+        self.unique_loc = 0
+        self.lookups = 0
+        self.hits = 0
+
+    def get_blob_shas(self, root_path: str, source_files: list) -> dict:
+        """
+        Returns relative path -> blob SHA for the given (relative_path, language) files, from the git index when
+        available and by hashing the file contents otherwise (e.g. unpacked archives)
+        """
+        git_blob_shas = read_git_blob_shas(root_path)
+        blob_shas = {}
+        for relative_path, _ in source_files:
+            blob_sha = git_blob_shas.get(relative_path)
+            if blob_sha is None:
+                try:
+                    blob_sha = hash_blob(os.path.join(root_path, relative_path))
+                except OSError:
+                    continue
+            blob_shas[relative_path] = blob_sha
+        return blob_shas
+
+    def lookup(self, blob_shas: list) -> dict:
+        """
+        Returns (blob SHA, language) -> (blank, comment, code) for the blobs that are already in the index. \n
+        The language is part of the key because the same content can be classified differently by file name.
+        """
+        known = {}
+        unique_blob_shas = list(set(blob_shas))
+        with self.lock:
+            for start in range(0, len(unique_blob_shas), LOOKUP_BATCH_SIZE):
+                batch = unique_blob_shas[start:start + LOOKUP_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                for blob_sha, language, blank, comment, code in self.connection.execute(f"SELECT blob_sha, language, blank, comment, code FROM blobs WHERE blob_sha IN ({placeholders})", batch):
+                    known[(blob_sha, language)] = (blank, comment, code)
+        return known
+
+    def record_lookups(self, lookups: int, hits: int):
+        with self.lock:
+            self.lookups += lookups
+            self.hits += hits
+
+    def store(self, counted_blobs: dict):
+        """
+        Adds (blob SHA, language) -> (blank, comment, code) entries to the index
+        """
+        with self.lock:
+            self.connection.executemany("INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?)", [(blob_sha, language, *counts) for (blob_sha, language), counts in counted_blobs.items()])
+            self.connection.commit()
+
+    def record_seen(self, blob_codes: dict, scan_key: int = 0) -> int:
+        """
+        Adds the code lines of blobs not seen before in this run (or scan) to the unique lines of code total, and returns them
+        """
+        unique_loc = 0
+        with self.lock:
+            for blob_sha, code in blob_codes.items():
+                if self.connection.execute("INSERT OR IGNORE INTO run_blobs VALUES (?, ?)", (scan_key, blob_sha)).rowcount:
+                    unique_loc += code
+            if scan_key == 0:
+                self.unique_loc += unique_loc
+        return unique_loc
+
+    def start_scan(self) -> "BlobIndexScan":
+        """
+        Returns a view of the index for one scan of a long-lived Scanner, with its own lookup, hit and unique LOC counts
+        """
+        return BlobIndexScan(self, next(self.scan_keys))
+
+    def end_scan(self, scan_key: int):
+        with self.lock:
+            self.connection.execute("DELETE FROM run_blobs WHERE scan_key = ?", (scan_key,))
+
+    def close(self):
+        self.connection.close()
+
+class BlobIndexScan:
+    """
+    The blob index as seen by a single scan: lookups and stores go to the shared index, while lookups, hits and the
+    unique lines of code are counted for this scan only, so consecutive or concurrent scans do not add up. Call close() when the scan is done.
+    """
+    def __init__(self, blob_index: BlobIndex, scan_key: int):
+        self.blob_index = blob_index
+        self.scan_key = scan_key
+        self.lock = threading.Lock()
+        self.unique_loc = 0
+        self.lookups = 0
+        self.hits = 0
+
+    def get_blob_shas(self, root_path: str, source_files: list) -> dict:
+        return self.blob_index.get_blob_shas(root_path, source_files)
+
+    def lookup(self, blob_shas: list) -> dict:
+        return self.blob_index.lookup(blob_shas)
+
+    def store(self, counted_blobs: dict):
+        self.blob_index.store(counted_blobs)
+
+    def record_lookups(self, lookups: int, hits: int):
+        self.blob_index.record_lookups(lookups, hits)
+        with self.lock:
+            self.lookups += lookups
+            self.hits += hits
+
+    def record_seen(self, blob_codes: dict):
+        unique_loc = self.blob_index.record_seen(blob_codes, self.scan_key)
+        with self.lock:
+            self.unique_loc += unique_loc
+
+    def close(self):
+        self.blob_index.end_scan(self.scan_key)
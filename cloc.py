@@ -3,6 +3,13 @@ import subprocess
 import os
 import shutil
 import argparse
+import time
+from scan_cache import ScanCache, get_count_settings, resolve_head_sha, read_local_head_sha
+from cloc_report import parse_cloc_report, sum_languages, write_cloc_reports, format_sum_reports
+from blob_index import BlobIndex
+from line_counter import count_tree, create_count_process_pool
+from path_filter import PathFilter
+from run_profile import RunProfile, get_folder_size
 
 parser = argparse.ArgumentParser(description='Script to run cloc against repositories in a csv.')
 
@@ -11,14 +18,12 @@ parser.add_argument('--inputCsv', type=str, help='Input csv containing the repo
 parser.add_argument('--outputDir', type=str, help='Output folder that you want to dump the cloc reports to. Make sure not to add a trailing slash', required=True)
 parser.add_argument('--commandsFilePath', type=str, help="Path to write a text file containing the commands that were run during this invocation for reference later", required=True)
 parser.add_argument('--clocPath', type=str, help="Path to cloc executable. Default is 'cloc'", required=False, default="cloc")
-
-# Parse the arguments
-args = parser.parse_args()
-
-path_to_input_csv = args.inputCsv
-path_to_output_directory = args.outputDir
-path_to_cloc = args.clocPath
-path_to_commands_file = args.commandsFilePath
+parser.add_argument('--engine', type=str, choices=['cloc', 'builtin'], help="Line counting engine: 'cloc' runs the cloc executable, 'builtin' counts in-process and writes both reports in a single pass. Default is 'cloc'", required=False, default='cloc')
+parser.add_argument('--countProcesses', type=int, help='Number of processes the builtin engine shards the files of a single large repository across. Default is 1', required=False, default=1)
+parser.add_argument('--dedupe', action='store_true', help='With --engine builtin, look up files whose exact content was already counted (in another repository, a fork, or a previous run) instead of reading them again, and report the unique LOC with every distinct file counted once', required=False)
+parser.add_argument('--progress', action='store_true', help='Print a progress line with throughput and ETA after every repository', required=False)
+parser.add_argument('--exclude', type=str, action='append', default=[], help="Pattern of files or directories to exclude from counting in .gitignore syntax, e.g. 'node_modules/' or '*.min.js', on top of the .clocignore files in each repository. Can be given multiple times", required=False)
+parser.add_argument('--useCache', action='store_true', help='Skip repositories whose HEAD commit has not changed since the last run, reusing the existing reports in the output folder', required=False)
 
 def create_folder(folder_path):
     try :
@@ -34,80 +39,184 @@ def delete_folder(folder_path):
     except Exception as e:  # Catching a more general exception since it can raise different kinds of exceptions
         print(f"Error: {e} - {folder_path}")
 
-# Create folder to store reports
-create_folder(path_to_output_directory)
-
-
-# First, read in the CSV file and store rows for later processing
-repos_data = []
-with open(f"{path_to_input_csv}", mode='r') as csv_file:
-    csv_reader = csv.reader(csv_file)
-    for row in csv_reader:
-        repos_data.append(row)
-
-repo_report_file_names=""
-failed_repos = []
-success_repos = []
-total_repos_count=len(repos_data)
-command_strings = []
-# Now, loop through the stored rows
-for index, row in enumerate(repos_data, start=1):  # Adding an index starting from 1
-    repo_id, repo, repo_url = row
-    repo_report_file_name = f"{repo_id}.txt"
-    repo_report_by_file_file_name = f"{repo_id}-by-file.txt"
-    print(f"Processing repo {index}/{total_repos_count}: {repo} - repo_id: {repo_id}")
-    # Clone repo
-    try:
-        # Run git clone
-        command_full_string = f"git clone {repo_url}"
-        print(command_full_string)
-        command_strings.append(command_full_string)
-        subprocess.run(["git", "clone","--depth=1", repo_url, "--single-branch"], check=True)
-        print(f"Successfully cloned {repo_url}")
-        # Run cloc
+def write_list_file(repo_folder: str, exclude_patterns: list, list_file_path: str) -> bool:
+    """
+    Writes the files of repo_folder that are not excluded to list_file_path, one per line, for cloc's --list-file. \n
+    Returns False without writing anything if nothing is excluded, so cloc can be given the folder itself.
+    """
+    path_filter = PathFilter(repo_folder, exclude_patterns)
+    file_paths = [os.path.join(directory_path, file_name) for directory_path, _, file_names in path_filter.walk({".git"}) for file_name in file_names]
+    if not path_filter.excluded_count:
+        return False
+    with open(list_file_path, "w") as f:
+        f.writelines(f"{file_path}\n" for file_path in file_paths)
+    return True
+
+def read_input_csv(path_to_input_csv: str) -> list:
+    """
+    Returns the rows of the input csv: repo id, repo name, and git clone url with authentication token
+    """
+    repos_data = []
+    with open(f"{path_to_input_csv}", mode='r') as csv_file:
+        csv_reader = csv.reader(csv_file)
+        for row in csv_reader:
+            repos_data.append(row)
+    return repos_data
+
+def count_repositories(repos_data: list, path_to_output_directory: str, path_to_commands_file: str, path_to_cloc: str = "cloc", engine: str = "cloc",
+                       count_processes: int = 1, dedupe: bool = False, show_progress: bool = False, use_cache: bool = False, exclude_patterns: list = None) -> dict:
+    """
+    Clones and counts every repository in repos_data (rows of the input csv), writes their reports to path_to_output_directory,
+    and prints the summed report. Returns the ids of the successful and failed repositories. \n
+    Paths matching exclude_patterns or the .clocignore files of a repository are not counted (see path_filter.py).
+    """
+    run_profile = RunProfile(show_progress)
+    count_processes = max(1, count_processes)
+    dedupe = dedupe and engine == 'builtin'
+
+    # Create folder to store reports
+    create_folder(path_to_output_directory)
+
+    count_process_pool = None
+    if engine == 'builtin':
+        count_process_pool = create_count_process_pool(count_processes)
+
+    scan_cache = None
+    # cached results only apply to counts made with the same engine and exclusions
+    count_settings = get_count_settings(engine, exclude_patterns)
+    if use_cache:
+        scan_cache = ScanCache(os.path.join(path_to_output_directory, "scan-cache.jsonl"))
+
+    blob_index = None
+    if dedupe:
+        blob_index = BlobIndex(os.path.join(path_to_output_directory, "blob-index.sqlite"))
+
+    for _ in repos_data:
+        run_profile.repo_discovered()
+
+    repo_report_file_names=""
+    failed_repos = []
+    success_repos = []
+    total_repos_count=len(repos_data)
+    command_strings = []
+    # Now, loop through the stored rows
+    for index, row in enumerate(repos_data, start=1):  # Adding an index starting from 1
+        repo_id, repo, repo_url = row
+        repo_report_file_name = f"{repo_id}.txt"
+        repo_report_by_file_file_name = f"{repo_id}-by-file.txt"
+        print(f"Processing repo {index}/{total_repos_count}: {repo} - repo_id: {repo_id}")
         repo_report_file_name_path = os.path.join(path_to_output_directory, repo_report_file_name)
-        command_full_string = f"{path_to_cloc} --report-file={repo_report_file_name_path} {repo}"
-        print(command_full_string)
-        command_strings.append(command_full_string)
-        subprocess.run([f"{path_to_cloc}", f"--report-file={repo_report_file_name_path}", f"{repo}"], check=True)
-        # Run cloc by file
-        repo_report_by_file_file_name_path = os.path.join(path_to_output_directory, repo_report_by_file_file_name)
-        command_full_string = f"{path_to_cloc} --report-file={repo_report_by_file_file_name_path} {repo}"
-        print(command_full_string)
-        command_strings.append(command_full_string)
-        subprocess.run([f"{path_to_cloc}", f"--report-file={repo_report_by_file_file_name_path}", "--by-file", f"{repo}"], check=True)
-        # Delete repo
-        delete_folder(f"{repo}")
-        # Add report file name to list
-        repo_report_file_names += f"{repo_report_file_name_path} "
-        success_repos.append(repo_id)
-    except subprocess.CalledProcessError as e:
-        print(f"Failed to cloc for {repo_id} and git clone {repo_url}. Error: {e}")
-        failed_repos.append(repo_id)
-
-failed_repos_count = len(failed_repos)
-success_repos_count = len(success_repos)
-total_repos_count = failed_repos_count + success_repos_count
-
-print("RESULTS:")
-print("Sucessful repos:")
-print(success_repos)
-print("Failed repos:")
-print(failed_repos)
-
-print("Summarizing reports...")
-if (success_repos_count > 0):   
-    # Summarize reports using cloc
-    command_full_string = f"{path_to_cloc} --sum-report {repo_report_file_names}"
-    print(command_full_string)
-    command_strings.append(command_full_string)
-    subprocess.run([f"{path_to_cloc}", "--sum-reports"] + repo_report_file_names.split(), check=True)
-
-print(f"Complete! Successfully cloned and ran cloc for {success_repos_count} / {total_repos_count} repositories. See logs above for more details.")
-
-# Write out the commands that were run to a file
-if (len(command_strings) > 0):
-    with open(f"{path_to_commands_file}", "w") as f:
-        for command in command_strings:
-            f.write(f"{command}\n")
-    print(f"Commands that were run are written to {path_to_commands_file}")
\ No newline at end of file
+        # Reuse the previous reports if HEAD has not moved and they are still in the output folder
+        commit_sha = None
+        if scan_cache:
+            with run_profile.stage("cache_lookup", repo_id):
+                commit_sha = resolve_head_sha(repo_url, "")
+            cached_entry = scan_cache.lookup(repo_id, commit_sha, **count_settings)
+            if cached_entry and os.path.exists(repo_report_file_name_path):
+                print(f"Using cached reports for {repo_id} at commit {commit_sha}")
+                repo_report_file_names += f"{repo_report_file_name_path} "
+                success_repos.append(repo_id)
+                run_profile.repo_skipped()
+                continue
+        # Clone repo
+        try:
+            # Run git clone
+            command_full_string = f"git clone {repo_url}"
+            print(command_full_string)
+            command_strings.append(command_full_string)
+            with run_profile.stage("fetch", repo_id):
+                subprocess.run(["git", "clone","--depth=1", repo_url, "--single-branch"], check=True)
+            print(f"Successfully cloned {repo_url}")
+            # a shallow clone's object store is close to what was transferred
+            _, clone_bytes = get_folder_size(os.path.join(repo, ".git"))
+            run_profile.count("fetch_bytes", clone_bytes, repo_id)
+            if scan_cache:
+                commit_sha = read_local_head_sha(repo) or commit_sha
+            repo_report_by_file_file_name_path = os.path.join(path_to_output_directory, repo_report_by_file_file_name)
+            with run_profile.stage("count", repo_id):
+                if engine == 'builtin':
+                    # Count in-process, producing both reports from a single walk of the tree
+                    start_time = time.perf_counter()
+                    languages, by_file = count_tree(repo, count_process_pool, count_processes, blob_index, exclude_patterns)
+                    run_profile.count("files_counted", len(by_file), repo_id)
+                    write_cloc_reports(repo_report_file_name_path, repo_report_by_file_file_name_path, languages, by_file, time.perf_counter() - start_time)
+                    print(f"Counted {len(by_file)} files in {repo}. Reports written to {repo_report_file_name_path} and {repo_report_by_file_file_name_path}")
+                else:
+                    # Give cloc the files that survived the exclusions instead of the folder when anything is excluded
+                    list_file_path = os.path.join(path_to_output_directory, f"{repo_id}-list-file.txt")
+                    cloc_input = f"--list-file={list_file_path}" if write_list_file(repo, exclude_patterns, list_file_path) else f"{repo}"
+                    # Run cloc
+                    command_full_string = f"{path_to_cloc} --report-file={repo_report_file_name_path} {cloc_input}"
+                    print(command_full_string)
+                    command_strings.append(command_full_string)
+                    subprocess.run([f"{path_to_cloc}", f"--report-file={repo_report_file_name_path}", cloc_input], check=True)
+                    # Run cloc by file
+                    command_full_string = f"{path_to_cloc} --report-file={repo_report_by_file_file_name_path} {cloc_input}"
+                    print(command_full_string)
+                    command_strings.append(command_full_string)
+                    subprocess.run([f"{path_to_cloc}", f"--report-file={repo_report_by_file_file_name_path}", "--by-file", cloc_input], check=True)
+                    if os.path.exists(list_file_path):
+                        os.remove(list_file_path)
+                    languages = parse_cloc_report(repo_report_file_name_path)
+                    run_profile.count("files_counted", sum(counts["files"] for counts in languages.values()), repo_id)
+            if scan_cache:
+                scan_cache.store(repo_id, commit_sha, sum_languages(languages), languages, **count_settings)
+            # Delete repo
+            with run_profile.stage("cleanup", repo_id):
+                delete_folder(f"{repo}")
+            # Add report file name to list
+            repo_report_file_names += f"{repo_report_file_name_path} "
+            success_repos.append(repo_id)
+            run_profile.repo_completed(repo_id, sum_languages(languages))
+        except subprocess.CalledProcessError as e:
+            print(f"Failed to cloc for {repo_id} and git clone {repo_url}. Error: {e}")
+            failed_repos.append(repo_id)
+            run_profile.repo_completed(repo_id, 0)
+
+    failed_repos_count = len(failed_repos)
+    success_repos_count = len(success_repos)
+    total_repos_count = failed_repos_count + success_repos_count
+
+    print("RESULTS:")
+    print("Sucessful repos:")
+    print(success_repos)
+    print("Failed repos:")
+    print(failed_repos)
+
+    print("Summarizing reports...")
+    with run_profile.stage("aggregate"):
+        if (success_repos_count > 0 and engine == 'builtin'):
+            # The builtin reports use cloc's format, so they can be summarized without the cloc executable
+            print(format_sum_reports(repo_report_file_names.split()))
+        elif (success_repos_count > 0):
+            # Summarize reports using cloc
+            command_full_string = f"{path_to_cloc} --sum-report {repo_report_file_names}"
+            print(command_full_string)
+            command_strings.append(command_full_string)
+            subprocess.run([f"{path_to_cloc}", "--sum-reports"] + repo_report_file_names.split(), check=True)
+    if blob_index:
+        run_profile.count("blob_lookups", blob_index.lookups)
+        run_profile.count("blob_hits", blob_index.hits)
+        run_profile.count("unique_loc", blob_index.unique_loc)
+        print(f"Unique LOC (each distinct file counted once) for repositories counted in this run: {blob_index.unique_loc}. {blob_index.hits} / {blob_index.lookups} files were already in the blob index")
+        blob_index.close()
+    if count_process_pool:
+        count_process_pool.shutdown()
+    run_profile.write(os.path.join(path_to_output_directory, "run-profile.json"))
+
+    # Write out the commands that were run to a file
+    if (len(command_strings) > 0):
+        with open(f"{path_to_commands_file}", "w") as f:
+            for command in command_strings:
+                f.write(f"{command}\n")
+        print(f"Commands that were run are written to {path_to_commands_file}")
+    return {"success_repos": success_repos, "failed_repos": failed_repos}
+
+if __name__ == "__main__":
+    # Parse the arguments
+    args = parser.parse_args()
+    result = count_repositories(read_input_csv(args.inputCsv), args.outputDir, args.commandsFilePath, args.clocPath, args.engine,
+                                args.countProcesses, args.dedupe, args.progress, args.useCache, args.exclude)
+    success_repos_count = len(result["success_repos"])
+    total_repos_count = success_repos_count + len(result["failed_repos"])
+    print(f"Complete! Successfully cloned and ran cloc for {success_repos_count} / {total_repos_count} repositories. See logs above for more details.")
@@ -0,0 +1,110 @@
+import os
+import re
+
+# A row of a --by-file report: the file path followed by the blank, comment and code counts
+BY_FILE_ROW_PATTERN = re.compile(r"^(.*\S)\s+(\d+)\s+(\d+)\s+(\d+)\s*$")
+
+# Column headers used by cloc's plain text reports
+CLOC_REPORT_COLUMNS = ["files", "blank", "comment", "code"]
+
+def parse_cloc_report(report_file_path: str) -> dict:
+    """
+    Parses a cloc text report (as written by --report-file) into a dictionary of language -> counts. \n
+    Example: {"Python": {"files": 3, "blank": 10, "comment": 4, "code": 49}}
+    """
+    languages = {}
+    if not os.path.exists(report_file_path):
+        return languages
+    with open(report_file_path, "r", encoding="utf-8", errors="surrogateescape") as f:
+        for line in f:
+            parts = line.split()
+            # language names may contain spaces, so the four counts are taken from the right
+            if len(parts) < 5 or not all(part.isdigit() for part in parts[-4:]):
+                continue
+            language = " ".join(parts[:-4])
+            if language == "SUM:":
+                continue
+            languages[language] = dict(zip(CLOC_REPORT_COLUMNS, (int(part) for part in parts[-4:])))
+    return languages
+
+def parse_cloc_by_file_report(report_file_path: str) -> list:
+    """
+    Parses a --by-file report into a list of (file_path, blank, comment, code). \n
+    Returns None if the report does not exist.
+    """
+    if not os.path.exists(report_file_path):
+        return None
+    by_file = []
+    with open(report_file_path, "r", encoding="utf-8", errors="surrogateescape") as f:
+        for line in f:
+            match = BY_FILE_ROW_PATTERN.match(line)
+            if match is None or match.group(1) == "SUM:":
+                continue
+            by_file.append((match.group(1), int(match.group(2)), int(match.group(3)), int(match.group(4))))
+    return by_file
+
+def sum_languages(languages: dict) -> int:
+    """
+    Returns the total lines of code across all languages of a parsed report
+    """
+    return sum(counts["code"] for counts in languages.values())
+
+def format_table(header: list, rows: list, sum_row: list = None) -> str:
+    """
+    Formats rows the same way cloc's plain text reports do: a left aligned name column followed by right aligned counts
+    """
+    divider = "-" * 79
+    name_width = 79 - 15 * (len(header) - 1)
+    def format_row(row):
+        return f"{row[0]:<{name_width}}" + "".join(f"{value:>15}" for value in row[1:])
+    lines = [divider, format_row(header), divider]
+    lines.extend(format_row(row) for row in rows)
+    if sum_row is not None:
+        lines.extend([divider, format_row(sum_row)])
+    lines.append(divider)
+    return "\n".join(lines) + "\n"
+
+def format_cloc_report(languages: dict, elapsed_seconds: float = 0.0) -> str:
+    """
+    Formats a language -> counts dictionary as a cloc by-language report, sorted by code descending
+    """
+    rows = [[language] + [counts[column] for column in CLOC_REPORT_COLUMNS] for language, counts in sorted(languages.items(), key=lambda item: (-item[1]["code"], item[0]))]
+    sum_row = ["SUM:"] + [sum(counts[column] for counts in languages.values()) for column in CLOC_REPORT_COLUMNS]
+    return f"cloc-wrapper builtin counter  T={elapsed_seconds:.2f} s\n" + format_table(["Language"] + CLOC_REPORT_COLUMNS, rows, sum_row)
+
+def format_cloc_by_file_report(by_file: list, elapsed_seconds: float = 0.0) -> str:
+    """
+    Formats (relative_path, language, blank, comment, code) rows as a cloc --by-file report, sorted by code descending
+    """
+    rows = [[relative_path, blank, comment, code] for relative_path, _, blank, comment, code in sorted(by_file, key=lambda row: (-row[4], row[0]))]
+    sum_row = ["SUM:"] + [sum(row[index] for row in by_file) for index in (2, 3, 4)]
+    return f"cloc-wrapper builtin counter  T={elapsed_seconds:.2f} s\n" + format_table(["File", "blank", "comment", "code"], rows, sum_row)
+
+def write_cloc_reports(report_file_path: str, by_file_report_file_path: str, languages: dict, by_file: list, elapsed_seconds: float = 0.0):
+    """
+    Writes the by-language and by-file reports of a single repository in cloc's format, so they can be used with cloc --sum-reports
+    """
+    with open(report_file_path, "w", encoding="utf-8", errors="surrogateescape") as f:
+        f.write(format_cloc_report(languages, elapsed_seconds))
+    with open(by_file_report_file_path, "w", encoding="utf-8", errors="surrogateescape") as f:
+        f.write(format_cloc_by_file_report(by_file, elapsed_seconds))
+
+def format_sum_reports(report_file_paths: list) -> str:
+    """
+    Combines several by-language reports into the two summary tables printed by cloc --sum-reports: one by language and one by report file
+    """
+    languages = {}
+    report_rows = []
+    for report_file_path in report_file_paths:
+        report_languages = parse_cloc_report(report_file_path)
+        report_totals = [0, 0, 0, 0]
+        for language, counts in report_languages.items():
+            totals = languages.setdefault(language, dict.fromkeys(CLOC_REPORT_COLUMNS, 0))
+            for index, column in enumerate(CLOC_REPORT_COLUMNS):
+                totals[column] += counts[column]
+                report_totals[index] += counts[column]
+        report_rows.append([os.path.basename(report_file_path)] + report_totals)
+    report_rows.sort(key=lambda row: (-row[4], row[0]))
+    sum_row = ["SUM:"] + [sum(row[index] for row in report_rows) for index in range(1, 5)]
+    language_rows = [[language] + [counts[column] for column in CLOC_REPORT_COLUMNS] for language, counts in sorted(languages.items(), key=lambda item: (-item[1]["code"], item[0]))]
+    return format_table(["Language"] + CLOC_REPORT_COLUMNS, language_rows, sum_row) + "\n" + format_table(["File"] + CLOC_REPORT_COLUMNS, report_rows, sum_row)
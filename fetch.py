@@ -0,0 +1,117 @@
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import zipfile
+import zlib
+import requests
+import urllib3
+
+# Size of the read buffer wrapped around the HTTP response while streaming archives
+STREAM_BUFFER_SIZE = 1024 * 1024
+# Errors of a corrupt or truncated archive stream, from the archive formats and from urllib3 reading the response
+CORRUPT_ARCHIVE_ERRORS = (tarfile.TarError, zipfile.BadZipFile, EOFError, zlib.error, urllib3.exceptions.HTTPError)
+
+class ArchiveDownloadError(Exception):
+    def __init__(self, archive_url: str, status_code: int, reason: str):
+        super().__init__(f"Unable to download archive {archive_url}. Status code: {status_code}, Reason: {reason}")
+        self.status_code = status_code
+
+def resolve_member_path(destination_folder: str, member_name: str, strip_components: int) -> str:
+    """
+    Returns the path a member of an archive should be written to, or None if it should be skipped. \n
+    Members that would land outside of destination_folder (absolute paths, .., or drive letters, which os.path.join on
+    Windows resolves relative to that drive) are always skipped.
+    """
+    parts = [part for part in member_name.replace("\\", "/").split("/") if part not in ("", ".")]
+    parts = parts[strip_components:]
+    if not parts or os.path.isabs(member_name):
+        return None
+    if any(part == ".." or ":" in part or os.path.splitdrive(part)[0] for part in parts):
+        return None
+    member_path = os.path.join(destination_folder, *parts)
+    destination_path = os.path.abspath(destination_folder)
+    try:
+        is_inside = os.path.commonpath([destination_path, os.path.abspath(member_path)]) == destination_path
+    except ValueError:
+        # paths on different drives
+        is_inside = False
+    return member_path if is_inside else None
+
+def write_member(member_path: str, fileobj) -> int:
+    os.makedirs(os.path.dirname(member_path), exist_ok=True)
+    with open(member_path, "wb") as f:
+        shutil.copyfileobj(fileobj, f, STREAM_BUFFER_SIZE)
+        return f.tell()
+
+def extract_tar_stream(stream, destination_folder: str, strip_components: int = 1) -> int:
+    """
+    Extracts the regular files of a (optionally compressed) tar stream without seeking. \n
+    Github, Gitlab and Bitbucket wrap the tree in a single top level folder, which is stripped by default.
+    Returns the number of files written.
+    """
+    file_count = 0
+    with tarfile.open(fileobj=stream, mode="r|*") as tar:
+        for member in tar:
+            # Symlinks, devices, etc. are never counted, so only regular files are written
+            if not member.isreg():
+                continue
+            member_path = resolve_member_path(destination_folder, member.name, strip_components)
+            if member_path is None:
+                continue
+            write_member(member_path, tar.extractfile(member))
+            file_count += 1
+    return file_count
+
+def extract_zip_stream(stream, destination_folder: str) -> int:
+    """
+    Extracts the files of a zip stream. Zip archives keep their index at the end, so the stream is spooled to a
+    temporary file next to the destination first. \n
+    Azure DevOps zips contain the tree without a top level folder. Returns the number of files written.
+    """
+    file_count = 0
+    with tempfile.TemporaryFile(dir=os.path.dirname(os.path.abspath(destination_folder))) as spool:
+        shutil.copyfileobj(stream, spool, STREAM_BUFFER_SIZE)
+        spool.seek(0)
+        with zipfile.ZipFile(spool) as archive:
+            for member in archive.infolist():
+                if member.is_dir():
+                    continue
+                member_path = resolve_member_path(destination_folder, member.filename, 0)
+                if member_path is None:
+                    continue
+                with archive.open(member) as member_file:
+                    write_member(member_path, member_file)
+                file_count += 1
+    return file_count
+
+def download_archive(session: requests.Session, archive_url: str, destination_folder: str, rate_limiter = None, **kwargs) -> tuple:
+    """
+    Streams the archive at archive_url into destination_folder without writing the archive itself to disk (except zips). \n
+    The format is detected from the first bytes of the response. The request goes through rate_limiter (see rate_limit.py)
+    when one is given. Extra kwargs (auth, headers) are passed to session.get.
+    Returns (file_count, downloaded_bytes). Raises ArchiveDownloadError if the download fails or the archive is corrupt or truncated.
+    """
+    if rate_limiter is None:
+        response = session.get(archive_url, stream=True, **kwargs)
+    else:
+        response = rate_limiter.request(session.get, archive_url, stream=True, **kwargs)
+    with response:
+        if response.status_code != 200:
+            raise ArchiveDownloadError(archive_url, response.status_code, response.reason)
+        # undo any transfer encoding so the archive format can be recognized
+        response.raw.decode_content = True
+        # urllib3 closes the raw stream as soon as it is exhausted, which the buffered reader below treats as an error
+        response.raw.auto_close = False
+        stream = io.BufferedReader(response.raw, buffer_size=STREAM_BUFFER_SIZE)
+        os.makedirs(destination_folder, exist_ok=True)
+        try:
+            if stream.peek(4)[:4] == b"PK\x03\x04":
+                file_count = extract_zip_stream(stream, destination_folder)
+            else:
+                file_count = extract_tar_stream(stream, destination_folder)
+        except CORRUPT_ARCHIVE_ERRORS as e:
+            raise ArchiveDownloadError(archive_url, response.status_code, f"Corrupt or truncated archive. {type(e).__name__}: {e}") from e
+        # tell() reports the bytes read off the wire, before any transfer decoding
+        return file_count, response.raw.tell()
@@ -0,0 +1,106 @@
+import csv
+import heapq
+import json
+import os
+import tempfile
+import threading
+
+# Number of journal entries sorted in memory at once when merging the journal into the combined CSV
+MERGE_CHUNK_SIZE = 100000
+
+def read_journal(journal_file_path: str):
+    """
+    Yields the entries of a journal in the order they were written. \n
+    A partially written trailing line (from a crash mid-write) is ignored.
+    """
+    if not os.path.exists(journal_file_path):
+        return
+    with open(journal_file_path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+def ends_with_newline(file_path: str) -> bool:
+    with open(file_path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+class ResultJournal:
+    """
+    Append-only JSON lines journal of per-repository results. \n
+    Every entry is flushed and fsync'd as soon as it is written, so completed work survives a crash.
+    """
+    def __init__(self, journal_file_path: str, resume: bool):
+        self.journal_file_path = journal_file_path
+        self.lock = threading.Lock()
+        self.completed_repo_ids = set()
+        if resume:
+            for entry in read_journal(journal_file_path):
+                if entry["status"] == "success":
+                    self.completed_repo_ids.add(entry["repo_id"])
+            print(f"Resuming: {len(self.completed_repo_ids)} repositories already completed in {journal_file_path}")
+        self.file = open(journal_file_path, "a" if resume else "w")
+        if resume and self.file.tell() > 0 and not ends_with_newline(journal_file_path):
+            # end a partially written trailing line, so the next entry is not appended to it
+            self.file.write("\n")
+
+    def is_completed(self, repo_id: str) -> bool:
+        return repo_id in self.completed_repo_ids
+
+    def append(self, entry: dict):
+        with self.lock:
+            self.file.write(json.dumps(entry) + "\n")
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            if entry["status"] == "success":
+                self.completed_repo_ids.add(entry["repo_id"])
+
+    def close(self):
+        self.file.close()
+
+def write_sorted_chunk(entries: list, chunk_files: list):
+    entries.sort(key=lambda entry: (-entry["total_loc"], entry["repo_id"]))
+    chunk_file = tempfile.TemporaryFile(mode="w+")
+    for entry in entries:
+        chunk_file.write(json.dumps(entry) + "\n")
+    chunk_file.seek(0)
+    chunk_files.append(chunk_file)
+
+def merge_journal_into_csv(journal_file_path: str, csv_file_path: str) -> int:
+    """
+    Writes the successful entries of a journal to a CSV of repo_id and code, sorted by code descending. \n
+    Only the first successful entry of every repository is written, e.g. when a resumed run retried it. Entries are sorted
+    in bounded chunks that are then merged, so only the set of repo ids used to drop the duplicates grows with the number
+    of repositories.
+    Returns the total lines of code.
+    """
+    chunk_files = []
+    entries = []
+    seen_repo_ids = set()
+    for entry in read_journal(journal_file_path):
+        if entry["status"] != "success" or entry["repo_id"] in seen_repo_ids:
+            continue
+        seen_repo_ids.add(entry["repo_id"])
+        entries.append({"repo_id": entry["repo_id"], "total_loc": entry["total_loc"] or 0})
+        if len(entries) >= MERGE_CHUNK_SIZE:
+            write_sorted_chunk(entries, chunk_files)
+            entries = []
+    if entries:
+        write_sorted_chunk(entries, chunk_files)
+
+    total_loc_count = 0
+    sorted_streams = [(json.loads(line) for line in chunk_file) for chunk_file in chunk_files]
+    with open(csv_file_path, "w", newline='') as f:
+        csv_writer = csv.writer(f)
+        csv_writer.writerow(["repo_id", "code"])
+        for entry in heapq.merge(*sorted_streams, key=lambda entry: (-entry["total_loc"], entry["repo_id"])):
+            csv_writer.writerow([entry["repo_id"], entry["total_loc"]])
+            total_loc_count += int(entry["total_loc"])
+    for chunk_file in chunk_files:
+        chunk_file.close()
+    return total_loc_count
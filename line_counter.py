@@ -0,0 +1,376 @@
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from path_filter import PathFilter
+
+# Files are read through a large buffer so that repos with many small files do not pay for many small reads
+READ_BUFFER_SIZE = 1024 * 1024
+# Files with a NUL byte within the first BINARY_CHECK_SIZE bytes are treated as binary and skipped, like cloc
+BINARY_CHECK_SIZE = 8000
+# Repos with fewer source files than this are counted in-process, since shipping the work to other processes costs more than it saves
+PARALLEL_MIN_FILES = 2000
+# Each worker gets roughly this many shards so faster workers can pick up the slack of slower ones
+SHARDS_PER_PROCESS = 4
+# Bounds on the size of a shard, so tiny files are batched and no shard grows without limit
+MIN_SHARD_BYTES = 1024 * 1024
+MAX_SHARD_FILES = 5000
+# Directories that are never part of the counted source tree
+SKIPPED_DIRECTORIES = {".git", ".hg", ".svn"}
+
+C_STYLE_LINE_COMMENTS = ["//"]
+C_STYLE_BLOCK_COMMENTS = [("/*", "*/")]
+HTML_BLOCK_COMMENTS = [("<!--", "-->")]
+
+# Language names follow cloc so that reports from both engines can be combined
+LANGUAGES = {
+    "ActionScript": {"extensions": [".as"], "line_comments": C_STYLE_LINE_COMMENTS, "block_comments": C_STYLE_BLOCK_COMMENTS},
+    "Bourne Again Shell": {"extensions": [".bash"], "line_comments": ["#"]},
+    "Bourne Shell": {"extensions": [".sh"], "line_comments": ["#"]},
+    "C": {"extensions": [".c"], "line_comments": C_STYLE_LINE_COMMENTS, "block_comments": C_STYLE_BLOCK_COMMENTS},
+    "C#": {"extensions": [".cs"], "line_comments": C_STYLE_LINE_COMMENTS, "block_comments": C_STYLE_BLOCK_COMMENTS},
+    "C++": {"extensions": [".cc", ".cpp", ".cxx", ".c++"], "line_comments": C_STYLE_LINE_COMMENTS, "block_comments": C_STYLE_BLOCK_COMMENTS},
+    "C/C++ Header": {"extensions": [".h", ".hh", ".hpp", ".hxx"], "line_comments": C_STYLE_LINE_COMMENTS, "block_comments": C_STYLE_BLOCK_COMMENTS},
+    "Clojure": {"extensions": [".clj", ".cljs", ".cljc"], "line_comments": [";"]},
+    "CMake": {"extensions": [".cmake"], "file_names": ["CMakeLists.txt"], "line_comments": ["#"]},
+    "COBOL": {"extensions": [".cbl", ".cob", ".cpy"], "line_comments": ["*>"]},
+    "CSS": {"extensions": [".css"], "block_comments": C_STYLE_BLOCK_COMMENTS},
+    "Dart": {"extensions": [".dart"], "line_comments": C_STYLE_LINE_COMMENTS, "block_comments": C_STYLE_BLOCK_COMMENTS},
+    "Dockerfile": {"extensions": [".dockerfile"], "file_names": ["Dockerfile"], "line_comments": ["#"]},
+    "Elixir": {"extensions": [".ex", ".exs"], "line_comments": ["#"]},
+    "Erlang": {"extensions": [".erl", ".hrl"], "line_comments": ["%"]},
+    "F#": {"extensions": [".fs", ".fsi", ".fsx"], "line_comments": C_STYLE_LINE_COMMENTS, "block_comments": [("(*", "*)")]},
+    "Go": {"extensions": [".go"], "line_comments": C_STYLE_LINE_COMMENTS, "block_comments": C_STYLE_BLOCK_COMMENTS},
+    "Groovy": {"extensions": [".groovy", ".gradle"], "line_comments": C_STYLE_LINE_COMMENTS, "block_comments": C_STYLE_BLOCK_COMMENTS},
+    "Haskell": {"extensions": [".hs"], "line_comments": ["--"], "block_comments": [("{-", "-}")]},
+    "HCL": {"extensions": [".tf", ".hcl"], "line_comments": ["#", "//"], "block_comments": C_STYLE_BLOCK_COMMENTS},
+    "HTML": {"extensions": [".html", ".htm"], "block_comments": HTML_BLOCK_COMMENTS},
+    "Java": {"extensions": [".java"], "line_comments": C_STYLE_LINE_COMMENTS, "block_comments": C_STYLE_BLOCK_COMMENTS},
+    "JavaScript": {"extensions": [".js", ".mjs", ".cjs"], "line_comments": C_STYLE_LINE_COMMENTS, "block_comments": C_STYLE_BLOCK_COMMENTS},
+    "JSON": {"extensions": [".json"]},
+    "JSX": {"extensions": [".jsx"], "line_comments": C_STYLE_LINE_COMMENTS, "block_comments": C_STYLE_BLOCK_COMMENTS},
+    "Kotlin": {"extensions": [".kt", ".kts"], "line_comments": C_STYLE_LINE_COMMENTS, "block_comments": C_STYLE_BLOCK_COMMENTS},
+    "Less": {"extensions": [".less"], "line_comments": C_STYLE_LINE_COMMENTS, "block_comments": C_STYLE_BLOCK_COMMENTS},
+    "Lua": {"extensions": [".lua"], "line_comments": ["--"], "block_comments": [("--[[", "]]")]},
+    "make": {"extensions": [".mk", ".mak"], "file_names": ["Makefile", "makefile", "GNUmakefile"], "line_comments": ["#"]},
+    "Markdown": {"extensions": [".md", ".markdown"], "block_comments": HTML_BLOCK_COMMENTS},
+    "Objective-C": {"extensions": [".m"], "line_comments": C_STYLE_LINE_COMMENTS, "block_comments": C_STYLE_BLOCK_COMMENTS},
+    "Objective-C++": {"extensions": [".mm"], "line_comments": C_STYLE_LINE_COMMENTS, "block_comments": C_STYLE_BLOCK_COMMENTS},
+    "Perl": {"extensions": [".pl", ".pm"], "line_comments": ["#"]},
+    "PHP": {"extensions": [".php"], "line_comments": ["//", "#"], "block_comments": C_STYLE_BLOCK_COMMENTS},
+    "PowerShell": {"extensions": [".ps1", ".psm1", ".psd1"], "line_comments": ["#"], "block_comments": [("<#", "#>")]},
+    "Protocol Buffers": {"extensions": [".proto"], "line_comments": C_STYLE_LINE_COMMENTS, "block_comments": C_STYLE_BLOCK_COMMENTS},
+    "Python": {"extensions": [".py", ".pyw"], "line_comments": ["#"], "docstrings": ['"""', "'''"]},
+    "R": {"extensions": [".r", ".R"], "line_comments": ["#"]},
+    "Ruby": {"extensions": [".rb", ".rake"], "file_names": ["Rakefile", "Gemfile"], "line_comments": ["#"], "block_comments": [("=begin", "=end")]},
+    "Rust": {"extensions": [".rs"], "line_comments": C_STYLE_LINE_COMMENTS, "block_comments": C_STYLE_BLOCK_COMMENTS},
+    "Sass": {"extensions": [".sass"], "line_comments": C_STYLE_LINE_COMMENTS, "block_comments": C_STYLE_BLOCK_COMMENTS},
+    "Scala": {"extensions": [".scala", ".sc"], "line_comments": C_STYLE_LINE_COMMENTS, "block_comments": C_STYLE_BLOCK_COMMENTS},
+    "SCSS": {"extensions": [".scss"], "line_comments": C_STYLE_LINE_COMMENTS, "block_comments": C_STYLE_BLOCK_COMMENTS},
+    "SQL": {"extensions": [".sql"], "line_comments": ["--"], "block_comments": C_STYLE_BLOCK_COMMENTS},
+    "Swift": {"extensions": [".swift"], "line_comments": C_STYLE_LINE_COMMENTS, "block_comments": C_STYLE_BLOCK_COMMENTS},
+    "TOML": {"extensions": [".toml"], "line_comments": ["#"]},
+    "TypeScript": {"extensions": [".ts", ".tsx", ".mts", ".cts"], "line_comments": C_STYLE_LINE_COMMENTS, "block_comments": C_STYLE_BLOCK_COMMENTS},
+    "Visual Basic .NET": {"extensions": [".vb"], "line_comments": ["'"]},
+    "Vuejs Component": {"extensions": [".vue"], "line_comments": C_STYLE_LINE_COMMENTS, "block_comments": C_STYLE_BLOCK_COMMENTS + HTML_BLOCK_COMMENTS},
+    "XML": {"extensions": [".xml", ".xsd", ".xsl", ".xslt"], "block_comments": HTML_BLOCK_COMMENTS},
+    "YAML": {"extensions": [".yaml", ".yml"], "line_comments": ["#"]},
+}
+
+def build_comment_table(language: dict) -> dict:
+    """
+    Encodes the comment delimiters of a language once so lines can be matched as bytes without decoding
+    """
+    return {
+        "line_comments": [token.encode() for token in language.get("line_comments", [])],
+        "block_comments": [(start.encode(), end.encode()) for start, end in language.get("block_comments", [])],
+        "docstrings": [token.encode() for token in language.get("docstrings", [])],
+    }
+
+COMMENT_TABLES = {name: build_comment_table(language) for name, language in LANGUAGES.items()}
+EXTENSION_TO_LANGUAGE = {extension: name for name, language in LANGUAGES.items() for extension in language["extensions"]}
+FILE_NAME_TO_LANGUAGE = {file_name: name for name, language in LANGUAGES.items() for file_name in language.get("file_names", [])}
+
+def get_source_file_patterns() -> list:
+    """
+    Returns gitignore style patterns matching every file the builtin engine recognizes, e.g. for a sparse checkout
+    """
+    patterns = [f"*{extension}" for extension in EXTENSION_TO_LANGUAGE]
+    patterns.extend(FILE_NAME_TO_LANGUAGE)
+    return patterns
+
+def classify_file(file_path: str) -> str:
+    """
+    Returns the language of a file based on its name or extension, or None if it is not a recognized source file
+    """
+    file_name = os.path.basename(file_path)
+    if file_name in FILE_NAME_TO_LANGUAGE:
+        return FILE_NAME_TO_LANGUAGE[file_name]
+    extension = os.path.splitext(file_name)[1]
+    return EXTENSION_TO_LANGUAGE.get(extension) or EXTENSION_TO_LANGUAGE.get(extension.lower())
+
+def find_first_comment(line: bytes, position: int, comment_table: dict):
+    """
+    Returns (index, start_token, block_end_token) of the earliest comment start in line at or after position. \n
+    block_end_token is None for line comments. Returns None if the rest of the line contains no comment.
+    When several tokens start at the same index the longest wins, so Lua's --[[ opens a block rather than a -- line comment.
+    """
+    first = None
+    for token in comment_table["line_comments"]:
+        index = line.find(token, position)
+        if index != -1 and (first is None or index < first[0] or (index == first[0] and len(token) > len(first[1]))):
+            first = (index, token, None)
+    for start, end in comment_table["block_comments"]:
+        index = line.find(start, position)
+        if index != -1 and (first is None or index < first[0] or (index == first[0] and len(start) > len(first[1]))):
+            first = (index, start, end)
+    return first
+
+def count_lines(lines, language: str) -> tuple:
+    """
+    Counts the blank, comment, and code lines of an iterable of byte lines. \n
+    Like cloc, a line that contains both code and a comment counts as code.
+    Returns (blank, comment, code).
+    """
+    comment_table = COMMENT_TABLES[language]
+    blank = comment = code = 0
+    block_end = None
+    for raw_line in lines:
+        line = raw_line.strip()
+        if not line:
+            blank += 1
+            continue
+        has_code = False
+        position = 0
+        while position < len(line):
+            if block_end is not None:
+                index = line.find(block_end, position)
+                if index == -1:
+                    break
+                position = index + len(block_end)
+                block_end = None
+                continue
+            # Docstrings only count as comments when they open the line, otherwise they are ordinary strings
+            if position == 0 and comment_table["docstrings"]:
+                docstring = next((token for token in comment_table["docstrings"] if line.startswith(token)), None)
+                if docstring:
+                    block_end = docstring
+                    position = len(docstring)
+                    continue
+            first_comment = find_first_comment(line, position, comment_table)
+            if first_comment is None:
+                has_code = True
+                break
+            index, start, end = first_comment
+            if line[position:index].strip():
+                has_code = True
+            if end is None:
+                break
+            block_end = end
+            position = index + len(start)
+        if has_code:
+            code += 1
+        else:
+            comment += 1
+    return blank, comment, code
+
+def is_binary_file(f) -> bool:
+    return b"\0" in f.peek(BINARY_CHECK_SIZE)[:BINARY_CHECK_SIZE]
+
+def count_file(file_path: str, language: str = None) -> tuple:
+    """
+    Counts a single file. Returns (language, blank, comment, code), or None if the file is not a recognized text source file.
+    """
+    language = language or classify_file(file_path)
+    if language is None:
+        return None
+    try:
+        with open(file_path, "rb", buffering=READ_BUFFER_SIZE) as f:
+            if is_binary_file(f):
+                return None
+            blank, comment, code = count_lines(f, language)
+    except OSError as e:
+        print(f"Unable to read {file_path}. Error: {e}")
+        return None
+    return language, blank, comment, code
+
+def classify_relative_path(relative_path: str) -> str:
+    """
+    Returns the language of a path relative to the root of a tree, or None if list_source_files would not include it
+    """
+    if any(part in SKIPPED_DIRECTORIES for part in relative_path.split(os.sep)):
+        return None
+    return classify_file(relative_path)
+
+def list_source_files(root_path: str, exclude_patterns: list = None) -> list:
+    """
+    Walks root_path and returns (relative_path, language) for every recognized source file. \n
+    Paths matching exclude_patterns or a .clocignore file in the tree are left out, and excluded directories are not walked (see path_filter.py).
+    """
+    source_files = []
+    for directory_path, _, file_names in PathFilter(root_path, exclude_patterns).walk(SKIPPED_DIRECTORIES):
+        for file_name in file_names:
+            language = classify_file(file_name)
+            if language is None:
+                continue
+            file_path = os.path.join(directory_path, file_name)
+            if os.path.islink(file_path):
+                continue
+            source_files.append((os.path.relpath(file_path, root_path), language))
+    return source_files
+
+def add_file_counts(languages: dict, language: str, blank: int, comment: int, code: int):
+    totals = languages.setdefault(language, {"files": 0, "blank": 0, "comment": 0, "code": 0})
+    totals["files"] += 1
+    totals["blank"] += blank
+    totals["comment"] += comment
+    totals["code"] += code
+
+def count_files(root_path: str, source_files: list) -> tuple:
+    """
+    Counts the given (relative_path, language) files under root_path. \n
+    Returns (languages, by_file) where languages maps language -> {files, blank, comment, code}
+    and by_file is a list of (relative_path, language, blank, comment, code).
+    """
+    languages = {}
+    by_file = []
+    for relative_path, language in source_files:
+        counts = count_file(os.path.join(root_path, relative_path), language)
+        if counts is None:
+            continue
+        _, blank, comment, code = counts
+        add_file_counts(languages, language, blank, comment, code)
+        by_file.append((relative_path, language, blank, comment, code))
+    return languages, by_file
+
+def plan_shards(root_path: str, source_files: list, process_count: int) -> list:
+    """
+    Splits source files into shards of roughly equal byte size. \n
+    Files are taken largest first, and any file bigger than the target shard size gets a shard of its own,
+    so a single huge generated file starts early instead of stalling a worker at the end.
+    """
+    sized_files = []
+    for relative_path, language in source_files:
+        try:
+            size = os.path.getsize(os.path.join(root_path, relative_path))
+        except OSError:
+            size = 0
+        sized_files.append((size, relative_path, language))
+    sized_files.sort(key=lambda sized_file: sized_file[0], reverse=True)
+    total_bytes = sum(size for size, _, _ in sized_files)
+    target_shard_bytes = max(MIN_SHARD_BYTES, total_bytes // (process_count * SHARDS_PER_PROCESS))
+
+    shards = []
+    shard = []
+    shard_bytes = 0
+    for size, relative_path, language in sized_files:
+        if size >= target_shard_bytes:
+            shards.append([(relative_path, language)])
+            continue
+        shard.append((relative_path, language))
+        shard_bytes += size
+        if shard_bytes >= target_shard_bytes or len(shard) >= MAX_SHARD_FILES:
+            shards.append(shard)
+            shard = []
+            shard_bytes = 0
+    if shard:
+        shards.append(shard)
+    return shards
+
+def merge_counts(languages: dict, by_file: list, shard_languages: dict, shard_by_file: list):
+    """
+    Merges the partial result of one shard into languages and by_file
+    """
+    for language, counts in shard_languages.items():
+        totals = languages.setdefault(language, {"files": 0, "blank": 0, "comment": 0, "code": 0})
+        for column, value in counts.items():
+            totals[column] += value
+    by_file.extend(shard_by_file)
+
+def update_counts(previous_by_file: list, root_path: str, changed_paths: list, exclude_patterns: list = None) -> tuple:
+    """
+    Applies a diff to a previous by-file result instead of counting the whole tree again. \n
+    previous_by_file holds (relative_path, blank, comment, code) rows. changed_paths are the paths that were added,
+    modified or deleted since; the current content of those that still exist must be under root_path, along with every .clocignore file of the tree.
+    Returns (languages, by_file) as described in count_files.
+    """
+    changed_paths = {os.path.normpath(path) for path in changed_paths}
+    path_filter = PathFilter(root_path, exclude_patterns)
+    languages = {}
+    by_file = []
+    for relative_path, blank, comment, code in previous_by_file:
+        language = classify_relative_path(relative_path)
+        if relative_path in changed_paths or language is None or path_filter.is_excluded(relative_path):
+            continue
+        add_file_counts(languages, language, blank, comment, code)
+        by_file.append((relative_path, language, blank, comment, code))
+    source_files = []
+    for relative_path in sorted(changed_paths):
+        language = classify_relative_path(relative_path)
+        file_path = os.path.join(root_path, relative_path)
+        # deleted files were not exported, so they are simply dropped
+        if language is None or not os.path.isfile(file_path) or os.path.islink(file_path) or path_filter.is_excluded(relative_path):
+            continue
+        source_files.append((relative_path, language))
+    changed_languages, changed_by_file = count_files(root_path, source_files)
+    merge_counts(languages, by_file, changed_languages, changed_by_file)
+    return languages, by_file
+
+def create_count_process_pool(process_count: int) -> ProcessPoolExecutor:
+    """
+    Creates a process pool for counting large repositories, or returns None if process_count is 1 or multiprocessing is unusable. \n
+    Workers are forked rather than spawned, so they start without re-importing the calling script.
+    Create the pool before starting any threads; on fork, all workers are started together on the first task, which is submitted here.
+    """
+    if process_count <= 1:
+        return None
+    if "fork" not in multiprocessing.get_all_start_methods():
+        print("Counting with multiple processes is not supported on this platform. Counting in a single process instead.")
+        return None
+    process_pool = ProcessPoolExecutor(max_workers=process_count, mp_context=multiprocessing.get_context("fork"))
+    process_pool.submit(os.getpid).result()
+    return process_pool
+
+def count_source_files(root_path: str, source_files: list, process_pool: ProcessPoolExecutor = None, process_count: int = 1) -> tuple:
+    """
+    Counts the given files, sharding them across process_pool when one is given and there are enough of them. \n
+    Returns (languages, by_file) as described in count_files.
+    """
+    if process_pool is None or len(source_files) < PARALLEL_MIN_FILES:
+        return count_files(root_path, source_files)
+    languages = {}
+    by_file = []
+    shards = plan_shards(root_path, source_files, process_count)
+    for shard_languages, shard_by_file in process_pool.map(count_files, [root_path] * len(shards), shards):
+        merge_counts(languages, by_file, shard_languages, shard_by_file)
+    return languages, by_file
+
+def count_tree(root_path: str, process_pool: ProcessPoolExecutor = None, process_count: int = 1, blob_index = None, exclude_patterns: list = None) -> tuple:
+    """
+    Counts every recognized source file under root_path in a single pass, leaving out excluded paths (see list_source_files). \n
+    Large trees are sharded across process_pool when one is given, and the partial counts are merged.
+    With a blob_index (see blob_index.py), files whose content was counted before are looked up instead of read.
+    Returns (languages, by_file) as described in count_files.
+    """
+    source_files = list_source_files(root_path, exclude_patterns)
+    if blob_index is None:
+        return count_source_files(root_path, source_files, process_pool, process_count)
+
+    languages = {}
+    by_file = []
+    blob_shas = blob_index.get_blob_shas(root_path, source_files)
+    known_blobs = blob_index.lookup(list(blob_shas.values()))
+    uncounted_files = []
+    for relative_path, language in source_files:
+        counts = known_blobs.get((blob_shas.get(relative_path), language))
+        if counts is None:
+            uncounted_files.append((relative_path, language))
+            continue
+        add_file_counts(languages, language, *counts)
+        by_file.append((relative_path, language, *counts))
+    blob_index.record_lookups(len(source_files), len(source_files) - len(uncounted_files))
+
+    counted_languages, counted_by_file = count_source_files(root_path, uncounted_files, process_pool, process_count)
+    merge_counts(languages, by_file, counted_languages, counted_by_file)
+    blob_index.store({(blob_shas[relative_path], language): (blank, comment, code) for relative_path, language, blank, comment, code in counted_by_file if relative_path in blob_shas})
+    blob_index.record_seen({blob_shas[relative_path]: code for relative_path, _, _, _, code in by_file if relative_path in blob_shas})
+    return languages, by_file
@@ -0,0 +1,113 @@
+import json
+import os
+import subprocess
+from fetch import extract_tar_stream
+from scan_cache import get_branch_ref
+
+# Ref in each mirror that holds the last fetched tip of the default branch. Keeping it between runs lets the next
+# fetch negotiate against it, so only objects that changed since the previous run are transferred.
+MIRROR_REF = "refs/heads/cloc-wrapper-tip"
+# Ref in each mirror that points at the commit the last reports were counted from, used as the base of incremental updates
+COUNTED_REF = "refs/heads/cloc-wrapper-counted"
+# Number of paths passed to a single git archive invocation when exporting only changed files
+ARCHIVE_PATHS_BATCH_SIZE = 500
+
+class MirrorError(Exception):
+    def __init__(self, command: str, exit_code: int):
+        super().__init__(f"{command} failed with exit code {exit_code}")
+        self.exit_code = exit_code
+
+def get_mirror_path(mirror_dir: str, repo_id: str) -> str:
+    return os.path.join(mirror_dir, f"{repo_id}.git")
+
+def get_mirror_fetch_commands(clone_url: str, default_branch: str, mirror_path: str) -> list:
+    """
+    Returns the git commands (as argument lists) that create the bare mirror if needed and fetch the tip of the default branch into it. \n
+    The clone url is passed on every fetch instead of being stored as a remote, so tokens are never written to the mirror.
+    """
+    commands = []
+    if not os.path.isdir(mirror_path):
+        commands.append(["git", "init", "--bare", "--quiet", mirror_path])
+    commands.append(["git", "-C", mirror_path, "fetch", "--depth=1", "--no-tags", "--quiet", clone_url, f"+{get_branch_ref(default_branch)}:{MIRROR_REF}"])
+    return commands
+
+def run_mirror_command(command: list):
+    exit_code = subprocess.run(command).returncode
+    if exit_code != 0:
+        raise MirrorError(" ".join(command), exit_code)
+
+def get_changed_files(mirror_path: str, from_sha: str, to_ref: str = MIRROR_REF) -> list:
+    """
+    Returns (status, path) for every file that differs between two commits of a mirror, as reported by git diff --name-status. \n
+    Renames are reported as a deletion and an addition.
+    """
+    command = ["git", "-C", mirror_path, "diff", "--name-status", "--no-renames", "-z", from_sha, to_ref]
+    result = subprocess.run(command, capture_output=True)
+    if result.returncode != 0:
+        raise MirrorError(" ".join(command), result.returncode)
+    # the output alternates between status and path: M\0path\0D\0path\0
+    fields = result.stdout.decode("utf-8", "surrogateescape").split("\0")
+    return [(fields[index][0], fields[index + 1]) for index in range(0, len(fields) - 1, 2)]
+
+def list_tree_files(mirror_path: str, file_name: str, ref: str = MIRROR_REF) -> list:
+    """
+    Returns the paths of every file named file_name in the tree of a mirror commit, without exporting anything
+    """
+    command = ["git", "-C", mirror_path, "ls-tree", "-r", "--name-only", "-z", ref]
+    result = subprocess.run(command, capture_output=True)
+    if result.returncode != 0:
+        raise MirrorError(" ".join(command), result.returncode)
+    paths = result.stdout.decode("utf-8", "surrogateescape").split("\0")
+    return [path for path in paths if path.rpartition("/")[2] == file_name]
+
+def get_counted_settings_path(mirror_path: str) -> str:
+    # kept next to the mirror rather than in it, so git gc and fetches never touch it
+    return f"{mirror_path}.counted.json"
+
+def read_counted_settings(mirror_path: str) -> dict:
+    """
+    Returns the count settings (see get_count_settings) that the commit at COUNTED_REF was counted with, or None if they are unknown
+    """
+    try:
+        with open(get_counted_settings_path(mirror_path), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def mark_counted(mirror_path: str, count_settings: dict):
+    """
+    Records the fetched tip as the base of the next incremental update, together with the count settings it was counted with. \n
+    The ref is moved first, so an interruption in between leaves settings that at worst force a full count.
+    """
+    run_mirror_command(["git", "-C", mirror_path, "update-ref", COUNTED_REF, MIRROR_REF])
+    settings_path = get_counted_settings_path(mirror_path)
+    with open(f"{settings_path}.tmp", "w") as f:
+        json.dump(count_settings, f)
+    os.replace(f"{settings_path}.tmp", settings_path)
+
+def run_git_archive(command: list, destination_folder: str) -> int:
+    process = subprocess.Popen(command, stdout=subprocess.PIPE)
+    try:
+        # git archive does not wrap the tree in a top level folder
+        file_count = extract_tar_stream(process.stdout, destination_folder, strip_components=0)
+    finally:
+        process.stdout.close()
+        exit_code = process.wait()
+    if exit_code != 0:
+        raise MirrorError(" ".join(command), exit_code)
+    return file_count
+
+def export_mirror_tree(mirror_path: str, destination_folder: str, paths: list = None) -> int:
+    """
+    Writes the files of the fetched tip into destination_folder by streaming git archive, without a checkout or any git metadata. \n
+    When paths is given, only those files are exported. Returns the number of files written.
+    """
+    os.makedirs(destination_folder, exist_ok=True)
+    if paths is None:
+        return run_git_archive(["git", "-C", mirror_path, "archive", "--format=tar", MIRROR_REF], destination_folder)
+    file_count = 0
+    for start in range(0, len(paths), ARCHIVE_PATHS_BATCH_SIZE):
+        # literal pathspecs, so file names containing * or : are not treated as patterns
+        command = ["git", "--literal-pathspecs", "-C", mirror_path, "archive", "--format=tar", MIRROR_REF, "--"] + paths[start:start + ARCHIVE_PATHS_BATCH_SIZE]
+        file_count += run_git_archive(command, destination_folder)
+    return file_count
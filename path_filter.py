@@ -0,0 +1,196 @@
+import os
+import re
+import shutil
+
+# Name of the files in a repository that list paths to exclude from counting, in .gitignore syntax
+IGNORE_FILE_NAME = ".clocignore"
+
+def translate_glob(pattern: str) -> str:
+    """
+    Translates a .gitignore style glob into a regular expression: * and ? do not match /, ** matches across directories
+    """
+    regex = []
+    index = 0
+    while index < len(pattern):
+        character = pattern[index]
+        if pattern.startswith("**/", index):
+            regex.append("(?:.*/)?")
+            index += 3
+        elif pattern.startswith("**", index):
+            regex.append(".*")
+            index += 2
+        elif character == "*":
+            regex.append("[^/]*")
+            index += 1
+        elif character == "?":
+            regex.append("[^/]")
+            index += 1
+        elif character == "[" and "]" in pattern[index + 2:]:
+            # the first character of a class may be a literal ], as in [][]
+            end = pattern.index("]", index + 2)
+            members = pattern[index + 1:end]
+            if members.startswith("!"):
+                members = "^" + members[1:]
+            regex.append(f"[{members.replace(chr(92), chr(92) * 2)}]")
+            index = end + 1
+        elif character == "\\" and index + 1 < len(pattern):
+            regex.append(re.escape(pattern[index + 1]))
+            index += 2
+        else:
+            regex.append(re.escape(character))
+            index += 1
+    return "".join(regex)
+
+def parse_pattern(line: str, base_directory: str = ""):
+    """
+    Parses one .gitignore style line into (regex, negated, directory_only), or None for blank lines and comments. \n
+    A pattern with a / other than at its end is relative to base_directory, otherwise it matches at any depth below it.
+    """
+    line = line.rstrip("\n").rstrip()
+    if not line or line.startswith("#"):
+        return None
+    negated = line.startswith("!")
+    if negated:
+        line = line[1:]
+    directory_only = line.endswith("/")
+    line = line.rstrip("/")
+    if not line:
+        return None
+    anchored = "/" in line
+    regex = translate_glob(line.lstrip("/"))
+    if not anchored:
+        regex = "(?:.*/)?" + regex
+    if base_directory:
+        regex = re.escape(base_directory) + "/" + regex
+    return regex, negated, directory_only
+
+def read_ignore_file(root_path: str, relative_directory: str) -> list:
+    """
+    Returns the parsed patterns of the ignore file in a directory of the tree, or an empty list if it has none
+    """
+    ignore_file_path = os.path.join(root_path, relative_directory, IGNORE_FILE_NAME)
+    try:
+        with open(ignore_file_path, "r", encoding="utf-8", errors="replace") as f:
+            lines = f.readlines()
+    except OSError:
+        return []
+    return [rule for rule in (parse_pattern(line, relative_directory) for line in lines) if rule]
+
+class PatternMatcher:
+    """
+    All patterns that apply within one directory, compiled into a single regular expression for files and one for directories. \n
+    Like .gitignore, the last matching pattern decides, so a later !pattern re-includes what an earlier one excluded.
+    """
+    def __init__(self, rules: list):
+        self.rules = rules
+        self.file_regex, self.file_negated = self.compile([rule for rule in rules if not rule[2]])
+        self.directory_regex, self.directory_negated = self.compile(rules)
+
+    def compile(self, rules: list) -> tuple:
+        if not rules:
+            return None, []
+        # alternatives are tried in order, so the last pattern goes first and the group that matched tells which pattern decided
+        ordered_rules = list(reversed(rules))
+        regex = re.compile("|".join(f"({regex})" for regex, _, _ in ordered_rules), re.DOTALL)
+        return regex, [negated for _, negated, _ in ordered_rules]
+
+    def is_excluded(self, relative_path: str, is_directory: bool) -> bool:
+        regex, negated = (self.directory_regex, self.directory_negated) if is_directory else (self.file_regex, self.file_negated)
+        if regex is None:
+            return False
+        match = regex.fullmatch(relative_path)
+        return match is not None and not negated[match.lastindex - 1]
+
+class PathFilter:
+    """
+    Decides which paths of a tree are excluded from counting, from exclude_patterns and the .clocignore files in the tree. \n
+    Patterns follow .gitignore syntax: * and ? match within a directory, ** across directories, a trailing / only
+    matches directories, a leading or inner / anchors the pattern to the root (or to the directory of its .clocignore),
+    and !pattern re-includes a path. Like git, a path can not be re-included once a parent directory is excluded, so
+    excluded directories are pruned from the walk without ever being read. Paths use / as separator.
+    """
+    def __init__(self, root_path: str, exclude_patterns: list = None):
+        self.root_path = root_path
+        rules = [rule for rule in (parse_pattern(pattern) for pattern in exclude_patterns or []) if rule]
+        self.matchers = {"": PatternMatcher(rules + read_ignore_file(root_path, ""))}
+        self.excluded_count = 0
+
+    def get_matcher(self, relative_directory: str) -> PatternMatcher:
+        """
+        Returns the matcher for paths in a directory, adding the patterns of its .clocignore (if any) to those of its parent
+        """
+        matcher = self.matchers.get(relative_directory)
+        if matcher is None:
+            parent_matcher = self.get_matcher(relative_directory.rpartition("/")[0])
+            rules = read_ignore_file(self.root_path, relative_directory)
+            matcher = PatternMatcher(parent_matcher.rules + rules) if rules else parent_matcher
+            self.matchers[relative_directory] = matcher
+        return matcher
+
+    def is_excluded(self, relative_path: str, is_directory: bool = False) -> bool:
+        """
+        Returns whether a path relative to the root is excluded, either itself or through one of its parent directories
+        """
+        parts = relative_path.replace(os.sep, "/").split("/")
+        for depth in range(1, len(parts)):
+            if self.get_matcher("/".join(parts[:depth - 1])).is_excluded("/".join(parts[:depth]), True):
+                return True
+        return self.get_matcher("/".join(parts[:-1])).is_excluded("/".join(parts), is_directory)
+
+    def walk(self, skipped_directories: set = frozenset()):
+        """
+        Walks the tree like os.walk, yielding (directory_path, relative_directory, file_names) with excluded directories
+        pruned before they are entered and excluded files removed. Ignore files themselves are never yielded.
+        """
+        for directory_path, directory_names, file_names in os.walk(self.root_path):
+            relative_directory = os.path.relpath(directory_path, self.root_path).replace(os.sep, "/")
+            if relative_directory == ".":
+                relative_directory = ""
+            prefix = f"{relative_directory}/" if relative_directory else ""
+            matcher = self.get_matcher(relative_directory)
+            kept_directory_names = []
+            for name in directory_names:
+                if name in skipped_directories:
+                    continue
+                if matcher.is_excluded(prefix + name, True):
+                    self.excluded_count += 1
+                    continue
+                kept_directory_names.append(name)
+            directory_names[:] = kept_directory_names
+            kept_file_names = []
+            for name in file_names:
+                if name == IGNORE_FILE_NAME:
+                    continue
+                if matcher.is_excluded(prefix + name, False):
+                    self.excluded_count += 1
+                    continue
+                kept_file_names.append(name)
+            yield directory_path, relative_directory, kept_file_names
+
+    def delete_excluded_paths(self, skipped_directories: set = frozenset()) -> int:
+        """
+        Deletes the excluded directories and files from the tree, for line counters that can only be given a directory. \n
+        Returns the number of deleted directories and files.
+        """
+        deleted_count = 0
+        for directory_path, directory_names, file_names in os.walk(self.root_path):
+            relative_directory = os.path.relpath(directory_path, self.root_path).replace(os.sep, "/")
+            if relative_directory == ".":
+                relative_directory = ""
+            prefix = f"{relative_directory}/" if relative_directory else ""
+            matcher = self.get_matcher(relative_directory)
+            kept_directory_names = []
+            for name in directory_names:
+                if name in skipped_directories:
+                    continue
+                if matcher.is_excluded(prefix + name, True):
+                    shutil.rmtree(os.path.join(directory_path, name), ignore_errors=True)
+                    deleted_count += 1
+                    continue
+                kept_directory_names.append(name)
+            directory_names[:] = kept_directory_names
+            for name in file_names:
+                if name == IGNORE_FILE_NAME or matcher.is_excluded(prefix + name, False):
+                    os.remove(os.path.join(directory_path, name))
+                    deleted_count += 1
+        return deleted_count
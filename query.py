@@ -0,0 +1,71 @@
+import argparse
+import json
+import os
+from cloc_report import format_table
+from results_store import ResultsStore, parse_as_of
+
+parser = argparse.ArgumentParser(description='Script to query the results store written by main.py --results_store: totals, largest repositories, language shares, and changes over time.')
+
+# Add arguments
+parser.add_argument('--results_store', type=str, help="Path of the results store. Default is 'output/results.sqlite'", required=False, default=os.path.join("output", "results.sqlite"))
+parser.add_argument('--organization', type=str, help='Only include this organization. By default all organizations in the store are included', required=False)
+parser.add_argument('--as_of', type=str, help='Query the results as they were at this date (e.g. 2024-06-30) or ISO 8601 time. Default is now', required=False)
+parser.add_argument('--json', action='store_true', help='Print the rows as JSON instead of a table', required=False)
+subparsers = parser.add_subparsers(dest='query', required=True)
+subparsers.add_parser('totals', help='Repositories and lines of code per organization')
+top_parser = subparsers.add_parser('top', help='Largest repositories by lines of code')
+top_parser.add_argument('--limit', type=int, help='Number of repositories. Default is 10', required=False, default=10)
+subparsers.add_parser('languages', help='Files and lines of code per language, with their share of all code. Only includes repositories counted with --engine builtin')
+delta_parser = subparsers.add_parser('delta', help='Change in lines of code per organization over a period, week over week by default')
+delta_parser.add_argument('--days', type=float, help='Length of the period in days. Default is 7', required=False, default=7)
+runs_parser = subparsers.add_parser('runs', help='Most recent runs')
+runs_parser.add_argument('--limit', type=int, help='Number of runs. Default is 10', required=False, default=10)
+
+def format_percent(value) -> str:
+    return "" if value is None else f"{value:.2f}%"
+
+def format_rows(query: str, rows: list) -> str:
+    """
+    Formats the rows of a query as a table like cloc's reports
+    """
+    if query == 'totals':
+        return format_table(["Organization", "repos", "code", "last scanned"], [[row["organization"], row["repos"], row["total_loc"], row["last_scanned_at"][:10]] for row in rows],
+                            ["SUM:", sum(row["repos"] for row in rows), sum(row["total_loc"] for row in rows), ""])
+    if query == 'top':
+        return format_table(["Repository", "code", "scanned"], [[row["repo_id"], row["total_loc"], row["scanned_at"][:10]] for row in rows])
+    if query == 'languages':
+        return format_table(["Language", "repos", "files", "code", "share"], [[row["language"], row["repos"], row["files"], row["code"], format_percent(100 * row["share"])] for row in rows],
+                            ["SUM:", "", sum(row["files"] for row in rows), sum(row["code"] for row in rows), format_percent(100.0 if rows else None)])
+    if query == 'delta':
+        return format_table(["Organization", "before", "now", "change", "change %"], [[row["organization"], row["previous_loc"], row["total_loc"], f"{row['change']:+d}", format_percent(row["change_percent"])] for row in rows])
+    return format_table(["Run", "organization", "finished", "complete", "code"], [[row["run_id"], row["organization"], (row["finished_at"] or "running")[:10], "yes" if row["complete"] else "no", row["total_loc"] or 0] for row in rows])
+
+if __name__ == "__main__":
+    # Parse the arguments
+    args = parser.parse_args()
+    if not os.path.exists(args.results_store):
+        parser.error(f"Results store {args.results_store} does not exist. Run main.py with --results_store first")
+    as_of = None
+    if args.as_of:
+        try:
+            as_of = parse_as_of(args.as_of)
+        except ValueError:
+            parser.error(f"--as_of must be a date like 2024-06-30 or an ISO 8601 time, not {args.as_of}")
+
+    results_store = ResultsStore(args.results_store)
+    if args.query == 'totals':
+        rows = results_store.get_totals(as_of, args.organization)
+    elif args.query == 'top':
+        rows = results_store.get_top_repos(args.limit, as_of, args.organization)
+    elif args.query == 'languages':
+        rows = results_store.get_language_shares(as_of, args.organization)
+    elif args.query == 'delta':
+        rows = results_store.get_deltas(args.days, as_of, args.organization)
+    else:
+        rows = results_store.get_runs(args.limit, args.organization)
+    results_store.close()
+
+    if args.json:
+        print(json.dumps(rows, indent=4))
+    else:
+        print(format_rows(args.query, rows), end="")
@@ -0,0 +1,161 @@
+import email.utils
+import random
+import threading
+import time
+import requests
+
+# Responses that are worth retrying: throttling and transient server errors
+TRANSIENT_STATUS_CODES = {429, 500, 502, 503, 504}
+# Upper bound of the exponential backoff between retries, before jitter
+MAX_BACKOFF_SECONDS = 60
+# X-RateLimit-Reset values above this are epoch timestamps (Github, Gitlab, Azure DevOps), smaller ones are seconds from now
+EPOCH_THRESHOLD = 1000000000
+# Requests are sent at full speed until the remaining budget drops below this share of the limit, then spread evenly until it resets
+RESERVE_FRACTION = 0.1
+# Reserve used when a provider reports the remaining budget without the limit
+DEFAULT_RESERVE = 100
+
+def parse_retry_after(value: str) -> float:
+    """
+    Returns the number of seconds a Retry-After header asks to wait, which is either a number of seconds or an HTTP date
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def parse_number(value: str) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+class RateLimiter:
+    """
+    Token bucket shared by every request to the DevOps provider, including archive downloads and git operations. \n
+    The bucket refills at max_requests_per_second when one is given. The rate limit headers of every response
+    (X-RateLimit-* / RateLimit-* on Github, Gitlab, Bitbucket and Azure DevOps, Retry-After) narrow it further:
+    once the remaining budget runs low it is spread evenly until the window resets, and an exhausted budget or
+    Retry-After pauses all callers. Transient failures are retried with exponential backoff and full jitter.
+    Safe to use from multiple threads.
+    """
+    def __init__(self, max_requests_per_second: float = 0, max_retries: int = 5):
+        self.lock = threading.Lock()
+        self.max_requests_per_second = max_requests_per_second or None
+        self.header_requests_per_second = None
+        self.max_retries = max_retries
+        # a small burst lets concurrent workers start together while staying within the rate on average
+        self.capacity = 4.0
+        self.tokens = self.capacity
+        self.last_refill_time = time.monotonic()
+        self.paused_until = 0.0
+        self.retries = 0
+        self.throttled_responses = 0
+
+    def get_rate(self) -> float:
+        rates = [rate for rate in (self.max_requests_per_second, self.header_requests_per_second) if rate]
+        return min(rates) if rates else None
+
+    def acquire(self):
+        """
+        Blocks until the caller may send a request
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                rate = self.get_rate()
+                if rate is None:
+                    self.tokens = self.capacity
+                else:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.last_refill_time) * rate)
+                self.last_refill_time = now
+                if now >= self.paused_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_seconds = self.paused_until - now
+                if rate is not None and self.tokens < 1:
+                    wait_seconds = max(wait_seconds, (1 - self.tokens) / rate)
+            time.sleep(wait_seconds)
+
+    def pause(self, seconds: float):
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def update_from_headers(self, headers):
+        """
+        Adapts the rate to the rate limit headers of a response. Header lookups on requests responses are case insensitive.
+        """
+        retry_after = parse_retry_after(headers.get("Retry-After"))
+        if retry_after:
+            self.pause(retry_after)
+        # Azure DevOps reports how long it already delayed the request once usage gets close to the limit
+        delay = parse_number(headers.get("X-RateLimit-Delay"))
+        if delay:
+            self.pause(delay)
+        remaining = parse_number(headers.get("X-RateLimit-Remaining") or headers.get("RateLimit-Remaining"))
+        reset = parse_number(headers.get("X-RateLimit-Reset") or headers.get("RateLimit-Reset"))
+        if remaining is None or reset is None:
+            return
+        seconds_until_reset = max(1.0, reset - time.time() if reset > EPOCH_THRESHOLD else reset)
+        if remaining <= 0:
+            print(f"Rate limit exhausted, pausing requests for {seconds_until_reset:.0f}s until it resets")
+            self.pause(seconds_until_reset)
+            return
+        limit = parse_number(headers.get("X-RateLimit-Limit") or headers.get("RateLimit-Limit"))
+        reserve = limit * RESERVE_FRACTION if limit else DEFAULT_RESERVE
+        with self.lock:
+            self.header_requests_per_second = remaining / seconds_until_reset if remaining < reserve else None
+
+    def is_throttled(self, response: requests.Response) -> bool:
+        if response.status_code in TRANSIENT_STATUS_CODES:
+            return True
+        # Github answers exceeded primary and secondary rate limits with 403
+        return response.status_code == 403 and (response.headers.get("Retry-After") is not None or response.headers.get("X-RateLimit-Remaining") == "0")
+
+    def wait_before_retry(self, attempt: int, description: str, reason: str):
+        delay_seconds = random.uniform(0, min(MAX_BACKOFF_SECONDS, 2 ** attempt))
+        with self.lock:
+            self.retries += 1
+        print(f"Retrying {description} in {delay_seconds:.1f}s after {reason} (attempt {attempt + 1})")
+        time.sleep(delay_seconds)
+
+    def request(self, send, url: str, **kwargs) -> requests.Response:
+        """
+        Sends a request with send (e.g. session.get) once the bucket allows it, retrying throttled and transient failures. \n
+        The last response is returned once it succeeds or the retries are used up.
+        """
+        for attempt in range(self.max_retries + 1):
+            self.acquire()
+            try:
+                response = send(url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.max_retries:
+                    raise
+                self.wait_before_retry(attempt, f"GET {url}", str(e))
+                continue
+            self.update_from_headers(response.headers)
+            if not self.is_throttled(response) or attempt == self.max_retries:
+                return response
+            with self.lock:
+                self.throttled_responses += 1
+            response.close()
+            self.wait_before_retry(attempt, f"GET {url}", f"status code {response.status_code}")
+
+    def run(self, operation, description: str, retry_exceptions: tuple, max_retries: int):
+        """
+        Runs operation (e.g. a git clone) once the bucket allows it, retrying up to max_retries times when it raises one of retry_exceptions
+        """
+        for attempt in range(max_retries + 1):
+            self.acquire()
+            try:
+                return operation()
+            except retry_exceptions as e:
+                if attempt == max_retries:
+                    raise
+                self.wait_before_retry(attempt, description, str(e))
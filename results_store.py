@@ -0,0 +1,218 @@
+import datetime
+import sqlite3
+import threading
+import time
+
+# Timestamps are stored as ISO 8601 UTC strings, which sort chronologically
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    organization TEXT NOT NULL,
+    devops TEXT NOT NULL,
+    started_at TEXT NOT NULL,
+    finished_at TEXT,
+    complete INTEGER NOT NULL DEFAULT 0,
+    repos_succeeded INTEGER,
+    repos_failed INTEGER,
+    total_loc INTEGER
+);
+CREATE INDEX IF NOT EXISTS runs_by_organization ON runs (organization, complete, finished_at, started_at);
+CREATE TABLE IF NOT EXISTS repo_scans (
+    scan_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id INTEGER NOT NULL REFERENCES runs (run_id),
+    organization TEXT NOT NULL,
+    repo_id TEXT NOT NULL,
+    project_name TEXT NOT NULL,
+    repository_name TEXT NOT NULL,
+    status TEXT NOT NULL,
+    total_loc INTEGER,
+    seconds REAL,
+    scanned_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS repo_scans_latest ON repo_scans (status, organization, repo_id, scanned_at);
+CREATE INDEX IF NOT EXISTS repo_scans_by_time ON repo_scans (organization, scanned_at, repo_id);
+CREATE TABLE IF NOT EXISTS repo_languages (
+    scan_id INTEGER NOT NULL REFERENCES repo_scans (scan_id),
+    language TEXT NOT NULL,
+    files INTEGER NOT NULL,
+    blank INTEGER NOT NULL,
+    comment INTEGER NOT NULL,
+    code INTEGER NOT NULL,
+    PRIMARY KEY (scan_id, language)
+) WITHOUT ROWID;
+"""
+
+# The latest successful scan of every repository as of :as_of. Once an organization had a complete run (every
+# repository discovered, not a rescan of a few), only repositories seen since the start of its latest one are included,
+# so deleted repositories drop out while a repository that failed in that run keeps its previous result.
+LATEST_SCANS = """
+WITH cutoffs AS (
+    SELECT organization, MAX(started_at) AS started_at FROM runs
+    WHERE complete = 1 AND finished_at <= :as_of AND (:organization IS NULL OR organization = :organization)
+    GROUP BY organization
+),
+present AS (
+    SELECT DISTINCT repo_scans.organization, repo_scans.repo_id FROM repo_scans LEFT JOIN cutoffs ON cutoffs.organization = repo_scans.organization
+    WHERE repo_scans.scanned_at <= :as_of AND (:organization IS NULL OR repo_scans.organization = :organization)
+    AND (cutoffs.started_at IS NULL OR repo_scans.scanned_at >= cutoffs.started_at)
+),
+latest_scan_ids AS (
+    SELECT organization, repo_id, MAX(scan_id) AS scan_id FROM repo_scans
+    WHERE status = 'success' AND scanned_at <= :as_of AND (:organization IS NULL OR organization = :organization)
+    GROUP BY organization, repo_id
+),
+latest AS (
+    SELECT repo_scans.* FROM latest_scan_ids
+    JOIN present ON present.organization = latest_scan_ids.organization AND present.repo_id = latest_scan_ids.repo_id
+    JOIN repo_scans ON repo_scans.scan_id = latest_scan_ids.scan_id
+)
+"""
+
+def format_timestamp(epoch_seconds: float = None) -> str:
+    return time.strftime(TIMESTAMP_FORMAT, time.gmtime(epoch_seconds))
+
+def parse_as_of(value: str) -> str:
+    """
+    Parses a date (2024-06-30, meaning the end of that day) or an ISO 8601 timestamp into a stored timestamp. Raises ValueError if it is neither.
+    """
+    if len(value) == 10:
+        return datetime.date.fromisoformat(value).strftime("%Y-%m-%dT23:59:59Z")
+    timestamp = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=datetime.timezone.utc)
+    return timestamp.astimezone(datetime.timezone.utc).strftime(TIMESTAMP_FORMAT)
+
+def shift_timestamp(timestamp: str, days: float) -> str:
+    return format_timestamp(datetime.datetime.strptime(timestamp, TIMESTAMP_FORMAT).replace(tzinfo=datetime.timezone.utc).timestamp() + days * 86400)
+
+class ResultsStore:
+    """
+    Results of every scan across organizations and runs, persisted in SQLite: a row per run, per repository scan, and
+    per language of a repository scan. \n
+    Queries aggregate the latest successful scan of every repository as of a point in time, so rescans of a few
+    repositories and resumed runs add up to complete organization totals without reading any report files.
+    Safe to use from multiple threads.
+    """
+    def __init__(self, store_file_path: str):
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(store_file_path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        # queries can read the store while a scan is writing to it
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(SCHEMA)
+
+    def start_run(self, organization: str, devops: str, resume: bool = False) -> int:
+        """
+        Records the start of a scan and returns its run id. A resumed scan continues the latest run of the organization.
+        """
+        with self.lock:
+            if resume:
+                row = self.connection.execute("SELECT run_id FROM runs WHERE organization = ? ORDER BY run_id DESC LIMIT 1", (organization,)).fetchone()
+                if row:
+                    return row["run_id"]
+            cursor = self.connection.execute("INSERT INTO runs (organization, devops, started_at) VALUES (?, ?, ?)", (organization, devops, format_timestamp()))
+            self.connection.commit()
+            return cursor.lastrowid
+
+    def record_repo(self, run_id: int, repo_info: dict, status: str, total_loc: int = None, languages: dict = None, seconds: float = None):
+        """
+        Records the outcome of a repository scan, with its language -> counts breakdown when the line counter reported one
+        """
+        with self.lock:
+            cursor = self.connection.execute(
+                "INSERT INTO repo_scans (run_id, organization, repo_id, project_name, repository_name, status, total_loc, seconds, scanned_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (run_id, repo_info["organization_name"], repo_info["id"], repo_info["project_name"], repo_info["repository_name"], status, total_loc, seconds, format_timestamp()))
+            self.connection.executemany("INSERT INTO repo_languages VALUES (?, ?, ?, ?, ?, ?)",
+                                        [(cursor.lastrowid, language, counts["files"], counts["blank"], counts["comment"], counts["code"]) for language, counts in (languages or {}).items()])
+            self.connection.commit()
+
+    def finish_run(self, run_id: int, complete: bool, repos_succeeded: int, repos_failed: int, total_loc: int):
+        """
+        Records the end of a run. complete means every repository of the organization was discovered.
+        """
+        with self.lock:
+            self.connection.execute("UPDATE runs SET finished_at = ?, complete = ?, repos_succeeded = ?, repos_failed = ?, total_loc = ? WHERE run_id = ?",
+                                    (format_timestamp(), int(complete), repos_succeeded, repos_failed, total_loc, run_id))
+            self.connection.commit()
+
+    def query(self, sql: str, as_of: str = None, organization: str = None, **parameters) -> list:
+        with self.lock:
+            rows = self.connection.execute(sql, {"as_of": as_of or format_timestamp(), "organization": organization, **parameters}).fetchall()
+        return [dict(row) for row in rows]
+
+    def get_totals(self, as_of: str = None, organization: str = None) -> list:
+        """
+        Returns the repositories and lines of code of every organization, largest first
+        """
+        return self.query(LATEST_SCANS + """
+            SELECT organization, COUNT(*) AS repos, SUM(total_loc) AS total_loc, MAX(scanned_at) AS last_scanned_at FROM latest
+            GROUP BY organization ORDER BY total_loc DESC, organization""", as_of, organization)
+
+    def get_top_repos(self, limit: int = 10, as_of: str = None, organization: str = None) -> list:
+        """
+        Returns the limit largest repositories by lines of code
+        """
+        return self.query(LATEST_SCANS + """
+            SELECT organization, repo_id, total_loc, scanned_at FROM latest
+            ORDER BY total_loc DESC, repo_id LIMIT :limit""", as_of, organization, limit=limit)
+
+    def get_language_shares(self, as_of: str = None, organization: str = None) -> list:
+        """
+        Returns the files and lines of code of every language with its share of all code, largest first. \n
+        Only repositories counted by an engine that reports languages (builtin or cached builtin results) are included.
+        """
+        rows = self.query(LATEST_SCANS + """
+            SELECT repo_languages.language, COUNT(*) AS repos, SUM(repo_languages.files) AS files, SUM(repo_languages.code) AS code FROM latest
+            JOIN repo_languages ON repo_languages.scan_id = latest.scan_id
+            GROUP BY repo_languages.language ORDER BY code DESC, repo_languages.language""", as_of, organization)
+        total_code = sum(row["code"] for row in rows)
+        for row in rows:
+            row["share"] = round(row["code"] / total_code, 4) if total_code else 0.0
+        return rows
+
+    def get_deltas(self, days: float = 7, as_of: str = None, organization: str = None) -> list:
+        """
+        Returns the change in repositories and lines of code of every organization over the days before as_of
+        """
+        as_of = as_of or format_timestamp()
+        previous_totals = {row["organization"]: row for row in self.get_totals(shift_timestamp(as_of, -days), organization)}
+        current_totals = {row["organization"]: row for row in self.get_totals(as_of, organization)}
+        deltas = []
+        for name in sorted(set(previous_totals) | set(current_totals)):
+            previous = previous_totals.get(name, {"repos": 0, "total_loc": 0})
+            current = current_totals.get(name, {"repos": 0, "total_loc": 0})
+            change = current["total_loc"] - previous["total_loc"]
+            deltas.append({
+                "organization": name,
+                "previous_repos": previous["repos"],
+                "repos": current["repos"],
+                "previous_loc": previous["total_loc"],
+                "total_loc": current["total_loc"],
+                "change": change,
+                "change_percent": round(100 * change / previous["total_loc"], 2) if previous["total_loc"] else None,
+            })
+        return sorted(deltas, key=lambda delta: (-abs(delta["change"]), delta["organization"]))
+
+    def get_repo_durations(self, organization: str) -> dict:
+        """
+        Returns repo_id -> seconds the latest successful scan of every repository of an organization took to fetch and count. \n
+        Cached results have no duration, so the last scan that actually counted a repository is used.
+        """
+        rows = self.query("""
+            SELECT repo_id, seconds FROM repo_scans WHERE scan_id IN (
+                SELECT MAX(scan_id) FROM repo_scans WHERE status = 'success' AND organization = :organization AND seconds IS NOT NULL GROUP BY repo_id
+            )""", None, organization)
+        return {row["repo_id"]: row["seconds"] for row in rows}
+
+    def get_runs(self, limit: int = 10, organization: str = None) -> list:
+        """
+        Returns the limit most recent runs
+        """
+        return self.query("""
+            SELECT run_id, organization, devops, started_at, finished_at, complete, repos_succeeded, repos_failed, total_loc FROM runs
+            WHERE :organization IS NULL OR organization = :organization ORDER BY run_id DESC LIMIT :limit""", None, organization, limit=limit)
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,163 @@
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+def percentile(values: list, fraction: float) -> float:
+    """
+    Returns the nearest-rank percentile of values, e.g. fraction 0.95 for p95
+    """
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+def summarize(values: list) -> dict:
+    return {
+        "count": len(values),
+        "total": round(sum(values), 3),
+        "p50": round(percentile(values, 0.5), 3),
+        "p95": round(percentile(values, 0.95), 3),
+        "max": round(max(values), 3),
+    }
+
+def get_folder_size(folder_path: str) -> tuple:
+    """
+    Returns (file_count, byte_count) of everything under folder_path
+    """
+    file_count = 0
+    byte_count = 0
+    for directory_path, _, file_names in os.walk(folder_path):
+        for file_name in file_names:
+            try:
+                byte_count += os.lstat(os.path.join(directory_path, file_name)).st_size
+                file_count += 1
+            except OSError:
+                continue
+    return file_count, byte_count
+
+# Stages that are spent waiting on other repositories rather than working on the repository itself
+WAIT_STAGES = {"scratch_wait"}
+
+def read_repo_durations(profile_file_path: str) -> dict:
+    """
+    Returns repo_id -> seconds spent fetching and counting each repository in a previously written run profile, or an empty dict if there is none. \n
+    Time spent in WAIT_STAGES is left out, it depends on the other repositories of the run.
+    """
+    try:
+        with open(profile_file_path, "r") as f:
+            repos = json.load(f).get("repos", [])
+    except (OSError, ValueError):
+        return {}
+    durations = {}
+    for repo in repos:
+        # cached results were never fetched or counted, so they say nothing about how long the repository takes
+        if "count_seconds" not in repo:
+            continue
+        durations[repo["repo_id"]] = sum(value for name, value in repo.items() if name.endswith("_seconds") and name.removesuffix("_seconds") not in WAIT_STAGES)
+    return durations
+
+class RunProfile:
+    """
+    Collects per-stage timings and counters for a run, both per repository and for the run as a whole. \n
+    Stages are timed with the stage() context manager; counters (bytes, files, pages) are added with count().
+    Safe to use from multiple threads.
+    """
+    def __init__(self, show_progress: bool = False):
+        self.show_progress = show_progress
+        self.lock = threading.Lock()
+        self.start_time = time.perf_counter()
+        self.repos = {}
+        self.run_stages = {}
+        self.run_counters = {}
+        self.repos_discovered = 0
+        self.repos_completed = 0
+        self.total_loc = 0
+
+    def get_repo(self, repo_id: str) -> dict:
+        return self.repos.setdefault(repo_id, {"repo_id": repo_id, "stages": {}, "counters": {}})
+
+    @contextmanager
+    def stage(self, name: str, repo_id: str = None):
+        """
+        Times the enclosed block. Without a repo_id the duration is recorded as a run level stage, e.g. a discovery page.
+        """
+        stage_start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed_seconds = time.perf_counter() - stage_start_time
+            with self.lock:
+                if repo_id is None:
+                    self.run_stages.setdefault(name, []).append(elapsed_seconds)
+                else:
+                    stages = self.get_repo(repo_id)["stages"]
+                    stages[name] = stages.get(name, 0.0) + elapsed_seconds
+
+    def count(self, name: str, value: int, repo_id: str = None):
+        with self.lock:
+            counters = self.run_counters if repo_id is None else self.get_repo(repo_id)["counters"]
+            counters[name] = counters.get(name, 0) + value
+
+    def get_repo_seconds(self, repo_id: str) -> float:
+        """
+        Returns the time spent working on a repository so far, leaving out WAIT_STAGES
+        """
+        with self.lock:
+            return sum(seconds for name, seconds in self.get_repo(repo_id)["stages"].items() if name not in WAIT_STAGES)
+
+    def repo_discovered(self):
+        with self.lock:
+            self.repos_discovered += 1
+
+    def repo_skipped(self):
+        with self.lock:
+            self.repos_completed += 1
+
+    def repo_completed(self, repo_id: str, total_loc: int):
+        with self.lock:
+            self.repos_completed += 1
+            self.total_loc += total_loc or 0
+            repo = self.get_repo(repo_id)
+            repo["counters"]["total_loc"] = total_loc or 0
+            count_seconds = repo["stages"].get("count")
+            if count_seconds:
+                repo["counters"]["loc_per_second"] = round((total_loc or 0) / count_seconds)
+            if self.show_progress:
+                print(self.format_progress())
+
+    def format_progress(self) -> str:
+        elapsed_seconds = time.perf_counter() - self.start_time
+        repos_per_second = self.repos_completed / elapsed_seconds if elapsed_seconds > 0 else 0
+        remaining_repos = self.repos_discovered - self.repos_completed
+        eta = f"{remaining_repos / repos_per_second:.0f}s" if repos_per_second > 0 else "unknown"
+        return (f"Progress: {self.repos_completed}/{self.repos_discovered} repositories, {elapsed_seconds:.0f}s elapsed, "
+                f"{repos_per_second * 60:.1f} repos/min, {self.total_loc / elapsed_seconds if elapsed_seconds > 0 else 0:.0f} LOC/s, ETA {eta} (for repositories discovered so far)")
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            repos = list(self.repos.values())
+            stage_values = {}
+            counter_values = {}
+            for repo in repos:
+                for name, seconds in repo["stages"].items():
+                    stage_values.setdefault(name, []).append(seconds)
+                for name, value in repo["counters"].items():
+                    counter_values.setdefault(name, []).append(value)
+            elapsed_seconds = time.perf_counter() - self.start_time
+            return {
+                "elapsed_seconds": round(elapsed_seconds, 3),
+                "repos_discovered": self.repos_discovered,
+                "repos_completed": self.repos_completed,
+                "total_loc": self.total_loc,
+                "run_stages": {name: summarize(values) for name, values in self.run_stages.items()},
+                "run_counters": dict(self.run_counters),
+                "repo_stage_seconds": {name: summarize(values) for name, values in stage_values.items()},
+                "repo_counters": {name: summarize(values) for name, values in counter_values.items()},
+                "repos": [{"repo_id": repo["repo_id"], **{f"{name}_seconds": round(seconds, 3) for name, seconds in repo["stages"].items()}, **repo["counters"]} for repo in repos],
+            }
+
+    def write(self, profile_file_path: str):
+        with open(profile_file_path, "w") as f:
+            json.dump(self.to_dict(), f, indent=4)
+        print(f"Run profile written to {profile_file_path}")
@@ -0,0 +1,97 @@
+import hashlib
+import json
+import os
+import subprocess
+import threading
+
+def get_branch_ref(default_branch: str) -> str:
+    """
+    Returns the full ref of the default branch, or HEAD if it is unknown. \n
+    Providers report the default branch either as a short name (main) or a full ref (refs/heads/main).
+    """
+    if not default_branch:
+        return "HEAD"
+    return default_branch if default_branch.startswith("refs/") else f"refs/heads/{default_branch}"
+
+def resolve_head_sha(clone_url: str, default_branch: str) -> str:
+    """
+    Returns the commit SHA of the default branch using git ls-remote, or None if it could not be resolved
+    """
+    ref = get_branch_ref(default_branch)
+    try:
+        result = subprocess.run(["git", "ls-remote", clone_url, ref], capture_output=True, text=True, check=True)
+    except (subprocess.CalledProcessError, OSError) as e:
+        print(f"Unable to resolve {ref} with git ls-remote. Error: {e}")
+        return None
+    for line in result.stdout.splitlines():
+        sha, _, name = line.partition("\t")
+        if name == ref:
+            return sha
+    return None
+
+def read_local_head_sha(repo_path: str, ref: str = "HEAD") -> str:
+    """
+    Returns the commit SHA checked out in a local clone (or of ref in a bare mirror), or None if it could not be read
+    """
+    try:
+        result = subprocess.run(["git", "-C", repo_path, "rev-parse", "--verify", "--quiet", f"{ref}^{{commit}}"], capture_output=True, text=True, check=True)
+    except (subprocess.CalledProcessError, OSError):
+        return None
+    return result.stdout.strip()
+
+def get_count_settings(engine: str, exclude_patterns: list = None) -> dict:
+    """
+    Returns the settings that change what a count reports, to be stored with and matched on every cached result
+    """
+    exclude_hash = hashlib.sha256(json.dumps(exclude_patterns or []).encode()).hexdigest()[:16]
+    return {"engine": engine, "exclude_hash": exclude_hash}
+
+class ScanCache:
+    """
+    Persistent result cache stored as JSON lines, keyed by repo id and default branch commit SHA. \n
+    An entry is only a hit if it was counted with the same settings (see get_count_settings).
+    The file is append-only; when a repo is scanned more than once the latest entry wins.
+    """
+    def __init__(self, cache_file_path: str):
+        self.cache_file_path = cache_file_path
+        self.entries = {}
+        self.lock = threading.Lock()
+        if os.path.exists(cache_file_path):
+            with open(cache_file_path, "r") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # a partially written trailing line from an interrupted run
+                        continue
+                    self.entries[entry["repo_id"]] = entry
+        print(f"Loaded {len(self.entries)} cached scan results from {cache_file_path}")
+
+    def lookup(self, repo_id: str, commit_sha: str, **settings) -> dict:
+        """
+        Returns the cached entry if the repo was last scanned at commit_sha with the given settings, otherwise None
+        """
+        if not commit_sha:
+            return None
+        entry = self.entries.get(repo_id)
+        if entry and entry["commit_sha"] == commit_sha and all(entry.get(name) == value for name, value in settings.items()):
+            return entry
+        return None
+
+    def store(self, repo_id: str, commit_sha: str, total_loc: int, languages: dict = None, **extra):
+        if not commit_sha or total_loc is None:
+            return
+        entry = {
+            "repo_id": repo_id,
+            "commit_sha": commit_sha,
+            "total_loc": total_loc,
+            "languages": languages or {},
+            **extra
+        }
+        with self.lock:
+            self.entries[repo_id] = entry
+            with open(self.cache_file_path, "a") as f:
+                f.write(json.dumps(entry) + "\n")
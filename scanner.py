@@ -0,0 +1,569 @@
+import argparse
+import json
+import os
+import shlex
+import shutil
+import subprocess
+import threading
+import time
+import requests
+from scan_cache import ScanCache, get_count_settings, resolve_head_sha, read_local_head_sha
+from fetch import download_archive, ArchiveDownloadError
+from mirror import MIRROR_REF, COUNTED_REF, MirrorError, get_mirror_path, get_mirror_fetch_commands, run_mirror_command, get_changed_files, list_tree_files, read_counted_settings, mark_counted, export_mirror_tree
+from blob_index import BlobIndex, BlobIndexScan
+from path_filter import IGNORE_FILE_NAME, PathFilter
+from line_counter import count_tree, update_counts, create_count_process_pool, get_source_file_patterns
+from cloc_report import parse_cloc_by_file_report, write_cloc_reports
+from journal import ResultJournal, read_journal, merge_journal_into_csv
+from run_profile import RunProfile, get_folder_size, read_repo_durations
+from schedule import PriorityExecutor, DurationEstimator
+from rate_limit import RateLimiter
+from scratch import ScratchSpace, parse_size, make_writable_and_delete
+from results_store import ResultsStore
+from discovery import Provider, DiscoveryError, create_session
+
+def delete_folder(folder_path):
+    absolute_path = os.path.abspath(folder_path)
+    if os.path.exists(absolute_path):
+        shutil.rmtree(absolute_path, onerror=make_writable_and_delete)
+    else:
+        print(f"The folder {absolute_path} does not exist.")
+
+def execute_go_cloc(go_cloc_command: list):
+    # Run the command and capture the output
+    try:
+        last_line = ""
+        with subprocess.Popen(go_cloc_command, stdout=subprocess.PIPE, text=True, errors="replace") as process:
+            for line in process.stdout:
+                print(line, end='')  # Print each line to standard output
+                last_line = line.strip()  # Keep track of the last line
+
+        # Parse the desired value from the last line
+        if last_line.isdigit():
+            total_loc = int(last_line)
+            return total_loc
+        else:
+            print("Expected output not found in the last line")
+            return None
+    except OSError as e:
+        print(f"Error executing {shlex.join(go_cloc_command)}: {e}")
+        raise
+
+class CloneError(Exception):
+    def __init__(self, clone_url: str, exit_code: int):
+        super().__init__(f"git clone failed for {clone_url} with exit code {exit_code}")
+        self.exit_code = exit_code
+
+def add_scan_arguments(parser: argparse.ArgumentParser):
+    """
+    Adds the arguments that configure a Scanner, shared by main.py and service.py
+    """
+    parser.add_argument('--go_cloc_path', type=str, help="Path to go-cloc executable. Default is 'go-cloc'", required=False, default="go-cloc")
+    parser.add_argument('--engine', type=str, choices=['go-cloc', 'builtin'], help="Line counting engine: 'go-cloc' runs the go-cloc executable, 'builtin' counts in-process and writes cloc style reports per repository. Default is 'go-cloc'", required=False, default='go-cloc')
+    parser.add_argument('--count_processes', type=int, help='Number of processes the builtin engine shards the files of a single large repository across. Default is 1', required=False, default=1)
+    parser.add_argument('--dedupe', action='store_true', help='With --engine builtin, look up files whose exact content was already counted (in another repository, a fork, or a previous run) instead of reading them again, and report the unique LOC with every distinct file counted once', required=False)
+    parser.add_argument('--discovery_workers', type=int, help='Number of repository listing pages to fetch concurrently during discovery. Default is 8', required=False, default=8)
+    parser.add_argument('--workers', type=int, help='Number of repositories to process concurrently. Default is 1 (sequential)', required=False, default=1)
+    parser.add_argument('--clone_workers', type=int, help='Maximum number of concurrent git clones. Defaults to --workers plus --large_repo_workers', required=False)
+    parser.add_argument('--count_workers', type=int, help='Maximum number of concurrent go-cloc runs. Defaults to the number of CPUs, capped at --workers', required=False)
+    parser.add_argument('--order', type=str, choices=['size', 'discovery'], help="Order to process repositories in: 'size' starts the longest first, estimated by how long they took in the previous run (from --results_store or run-profile.json) or else by the size the DevOps platform reports, 'discovery' keeps the order the API returns them in. Default is 'size'", required=False, default='size')
+    parser.add_argument('--large_repo_size', type=str, help="Repositories at least this size as reported by the DevOps platform (e.g. 5g) are processed on a separate lane of --large_repo_workers threads, in addition to --workers. By default there is no separate lane", required=False)
+    parser.add_argument('--large_repo_workers', type=int, help='Number of large repositories to process concurrently with --large_repo_size. Default is 1', required=False, default=1)
+    parser.add_argument('--fetch_mode', type=str, choices=['clone', 'archive', 'partial'], help="How to fetch each repository: 'clone' runs a shallow git clone, 'archive' streams the default branch as a tarball/zip from the provider API without any git metadata, 'partial' runs a shallow partial clone with a sparse checkout of the files the builtin engine recognizes, and requires --engine builtin. Default is 'clone'", required=False, default='clone')
+    parser.add_argument('--blob_limit', type=str, help="With --fetch_mode partial, blobs up to this size (e.g. 512k or 1m) are downloaded with the clone and larger ones only if the sparse checkout needs them. By default no blobs are downloaded with the clone (blob:none)", required=False)
+    parser.add_argument('--exclude', type=str, action='append', default=[], help="Pattern of files or directories to exclude from counting in .gitignore syntax, e.g. 'node_modules/' or '*.min.js', on top of the .clocignore files in each repository. Can be given multiple times. With --fetch_mode partial, excluded paths are never downloaded", required=False)
+    parser.add_argument('--scratch_budget', type=str, help="Maximum total size of the repositories in --scratch_dir at any time, e.g. 20g. New fetches wait until enough space is released. Repositories are estimated by the size the DevOps platform reports. By default there is no limit", required=False)
+    parser.add_argument('--mirror_dir', type=str, help="Directory to keep a persistent bare mirror of every repository in. Later runs only fetch what changed on the default branch and count an export of its tip, instead of cloning from scratch. Replaces --fetch_mode clone", required=False)
+    parser.add_argument('--incremental', action='store_true', help="With --mirror_dir and --engine builtin, only count the files that changed since the commit of the previous by-file report in the output directory, and update that report", required=False)
+    parser.add_argument('--scratch_dir', type=str, help="Directory that repositories are cloned or unpacked into while they are counted, e.g. a tmpfs mount. Default is the current directory", required=False, default='.')
+    parser.add_argument('--max_requests_per_second', type=float, help='Upper bound on requests to the DevOps provider (API calls, archive downloads and git operations) per second. By default only the rate limit headers of the provider are used to pace requests', required=False, default=0)
+    parser.add_argument('--max_retries', type=int, help='Number of times a throttled (429, or 403 from a rate limit) or failed (5xx, connection error) API request is retried with backoff. Default is 5', required=False, default=5)
+    parser.add_argument('--clone_retries', type=int, help='Number of times a failed git clone or fetch is retried with backoff. Default is 2', required=False, default=2)
+    parser.add_argument('--use_cache', action='store_true', help='Skip repositories whose default branch commit has not changed since the last run, reusing the cached results', required=False)
+    parser.add_argument('--results_store', type=str, help="Path of a SQLite database that accumulates the results of every run, repository, and language across organizations, for query.py. By default results are only written to the output directory", required=False)
+
+def create_scanner_from_args(args: argparse.Namespace, parser: argparse.ArgumentParser) -> "Scanner":
+    """
+    Creates a Scanner from the arguments added by add_scan_arguments, reporting invalid combinations through parser
+    """
+    try:
+        return Scanner(go_cloc_path=args.go_cloc_path, engine=args.engine, count_processes=args.count_processes, dedupe=args.dedupe,
+                       discovery_workers=args.discovery_workers, workers=args.workers, clone_workers=args.clone_workers, count_workers=args.count_workers,
+                       order=args.order, large_repo_size=parse_size(args.large_repo_size) if args.large_repo_size else None, large_repo_workers=args.large_repo_workers,
+                       fetch_mode=args.fetch_mode, blob_limit=args.blob_limit, exclude_patterns=args.exclude, scratch_dir=args.scratch_dir,
+                       scratch_budget=parse_size(args.scratch_budget) if args.scratch_budget else None, mirror_dir=args.mirror_dir, incremental=args.incremental,
+                       max_requests_per_second=args.max_requests_per_second, max_retries=args.max_retries, clone_retries=args.clone_retries, use_cache=args.use_cache,
+                       results_store_path=args.results_store)
+    except ValueError as e:
+        parser.error(str(e))
+
+class ScanRun:
+    """
+    State of a single scan: the provider it discovers from, its run profile and result journal, the callback that receives
+    every result, and its view of the blob index (see BlobIndexScan)
+    """
+    def __init__(self, provider: Provider, journal: ResultJournal, on_result=None, run_id: int = None, blob_index: BlobIndexScan = None):
+        self.provider = provider
+        self.run_profile = provider.run_profile
+        self.rate_limiter = provider.rate_limiter
+        self.journal = journal
+        self.on_result = on_result
+        # id of the run in the results store, if there is one
+        self.run_id = run_id
+        self.blob_index = blob_index
+
+class Scanner:
+    """
+    Discovers, fetches, counts, and aggregates the repositories of DevOps organizations. \n
+    Everything that is expensive to set up is created once and kept warm across scans: the pooled HTTP sessions, the rate
+    limiter of every provider, the repository worker threads, the count process pool, the scratch space, the scan cache,
+    and the blob index. Scans may run concurrently; they share the worker caps, and a repository is only processed by one
+    scan at a time. Call close() when done.
+    """
+    def __init__(self, output_dir: str = "output", go_cloc_path: str = "go-cloc", engine: str = "go-cloc", count_processes: int = 1, dedupe: bool = False,
+                 discovery_workers: int = 8, workers: int = 1, clone_workers: int = None, count_workers: int = None, order: str = "size",
+                 large_repo_size: int = None, large_repo_workers: int = 1, fetch_mode: str = "clone",
+                 blob_limit: str = None, exclude_patterns: list = None, scratch_dir: str = ".", scratch_budget: int = None, mirror_dir: str = None,
+                 incremental: bool = False, max_requests_per_second: float = 0, max_retries: int = 5, clone_retries: int = 2, use_cache: bool = False,
+                 results_store_path: str = None):
+        if mirror_dir and fetch_mode != 'clone':
+            raise ValueError("--mirror_dir can not be combined with --fetch_mode archive or partial")
+        if fetch_mode == 'partial' and engine != 'builtin':
+            # the sparse checkout only has the languages of the builtin engine, go-cloc would silently miss the others
+            raise ValueError("--fetch_mode partial requires --engine builtin")
+        dedupe = dedupe and engine == 'builtin'
+        if incremental and (not mirror_dir or engine != 'builtin' or dedupe):
+            raise ValueError("--incremental requires --mirror_dir and --engine builtin, and can not be combined with --dedupe")
+        self.output_dir = output_dir
+        self.go_cloc_path = go_cloc_path
+        self.engine = engine
+        self.count_processes = max(1, count_processes)
+        self.discovery_workers = max(1, discovery_workers)
+        self.workers = max(1, workers)
+        self.order = order
+        self.large_repo_size = large_repo_size
+        self.large_repo_workers = max(1, large_repo_workers) if large_repo_size else 0
+        # Clones are network bound and go-cloc is CPU bound, so each stage gets its own cap
+        self.clone_workers = max(1, clone_workers or self.workers + self.large_repo_workers)
+        self.count_workers = max(1, count_workers or min(self.workers, os.cpu_count() or 1))
+        self.fetch_mode = fetch_mode
+        self.blob_limit = blob_limit
+        self.exclude_patterns = exclude_patterns or []
+        # cached results only apply to counts made with the same engine and exclusions
+        self.count_settings = get_count_settings(engine, self.exclude_patterns)
+        self.mirror_dir = mirror_dir
+        self.incremental = incremental
+        self.max_requests_per_second = max_requests_per_second
+        self.max_retries = max(0, max_retries)
+        self.clone_retries = max(0, clone_retries)
+        os.makedirs(output_dir, exist_ok=True)
+        if mirror_dir:
+            os.makedirs(mirror_dir, exist_ok=True)
+
+        # Created before any threads are started, see create_count_process_pool
+        self.count_process_pool = None
+        if engine == 'builtin':
+            self.count_process_pool = create_count_process_pool(self.count_processes)
+        # A single session reuses connections across all discovery requests
+        self.discovery_session = create_session(self.discovery_workers)
+        # Archive downloads get their own pool sized for the number of concurrent fetches
+        self.fetch_session = create_session(self.clone_workers)
+        self.rate_limiters = {}
+        self.lock = threading.Lock()
+        self.repo_locks = {}
+        self.clone_semaphore = threading.Semaphore(self.clone_workers)
+        self.count_semaphore = threading.Semaphore(self.count_workers)
+        self.executor = PriorityExecutor(self.workers, self.large_repo_workers)
+        self.scratch_space = ScratchSpace(scratch_dir, scratch_budget)
+        self.scan_cache = None
+        if use_cache:
+            self.scan_cache = ScanCache(os.path.join(output_dir, "scan-cache.jsonl"))
+        self.blob_index = None
+        if dedupe:
+            self.blob_index = BlobIndex(os.path.join(output_dir, "blob-index.sqlite"))
+        self.results_store = None
+        if results_store_path:
+            os.makedirs(os.path.dirname(results_store_path) or ".", exist_ok=True)
+            self.results_store = ResultsStore(results_store_path)
+
+    def get_rate_limiter(self, devops: str, devops_base_url_override: str = None) -> RateLimiter:
+        """
+        Returns the rate limiter of a provider. It is shared by every thread and scan that talks to the provider, so all of them back off together when it throttles.
+        """
+        with self.lock:
+            key = (devops, devops_base_url_override)
+            if key not in self.rate_limiters:
+                self.rate_limiters[key] = RateLimiter(self.max_requests_per_second, self.max_retries)
+            return self.rate_limiters[key]
+
+    def get_repo_lock(self, repo_id: str) -> threading.Lock:
+        with self.lock:
+            return self.repo_locks.setdefault(repo_id, threading.Lock())
+
+    def get_by_file_report_path(self, repo_id: str) -> str:
+        return os.path.join(self.output_dir, f"{repo_id}-by-file.txt")
+
+    def execute_builtin_count(self, run: ScanRun, repo_id: str, repo_folder: str, changed_paths: list = None) -> tuple:
+        """
+        Counts a repository in-process and writes its by-language and by-file reports to the output directory. \n
+        When changed_paths is given, repo_folder only holds those files and the previous by-file report is updated instead.
+        Returns (languages, total_loc).
+        """
+        report_file_path = os.path.join(self.output_dir, f"{repo_id}.txt")
+        by_file_report_file_path = self.get_by_file_report_path(repo_id)
+        start_time = time.perf_counter()
+        if changed_paths is None:
+            languages, by_file = count_tree(repo_folder, self.count_process_pool, self.count_processes, run.blob_index, self.exclude_patterns)
+        else:
+            languages, by_file = update_counts(parse_cloc_by_file_report(by_file_report_file_path), repo_folder, changed_paths, self.exclude_patterns)
+        elapsed_seconds = time.perf_counter() - start_time
+        os.makedirs(self.output_dir, exist_ok=True)
+        write_cloc_reports(report_file_path, by_file_report_file_path, languages, by_file, elapsed_seconds)
+        total_loc = sum(counts["code"] for counts in languages.values())
+        run.run_profile.count("files_counted", len(by_file), repo_id)
+        print(f"Counted {len(by_file)} files in {repo_folder}: {total_loc} lines of code. Reports written to {report_file_path}")
+        print(f"{total_loc}")
+        return languages, total_loc
+
+    def run_git_command(self, run: ScanRun, command: list, clone_url: str, repo_folder: str = None):
+        """
+        Runs a git command (as an argument list, so paths with spaces need no quoting) that talks to the provider through
+        the rate limiter, retrying it when it fails. \n
+        When repo_folder is given, anything a failed attempt left behind is deleted before the next one.
+        """
+        def run_once():
+            if repo_folder and os.path.exists(repo_folder):
+                delete_folder(repo_folder)
+            exit_code = subprocess.run(command).returncode
+            if (exit_code != 0):
+                raise CloneError(clone_url, exit_code)
+        run.rate_limiter.run(run_once, shlex.join(command), (CloneError,), self.clone_retries)
+
+    def get_partial_clone_commands(self, clone_url: str, repo_folder: str) -> list:
+        """
+        Returns the commands (as argument lists) for a shallow partial clone that only downloads the blobs of recognized source files. \n
+        The clone itself fetches no file contents (or only small ones with --blob_limit); the sparse checkout then
+        lazily fetches the blobs matching the source patterns, minus the excluded paths.
+        """
+        blob_filter = f"blob:limit={self.blob_limit}" if self.blob_limit else "blob:none"
+        # the .clocignore files are checked out too, so the count can apply them
+        sparse_patterns = get_source_file_patterns() + [IGNORE_FILE_NAME]
+        for pattern in self.exclude_patterns:
+            # sparse checkout matches files, so a directory is only excluded by also excluding everything below it
+            sparse_patterns.extend([f"!{pattern}", f"!{pattern.rstrip('/')}/**"])
+        return [
+            ["git", "clone", "--depth=1", f"--filter={blob_filter}", "--no-checkout", clone_url, "--single-branch", repo_folder],
+            # set only accepts --no-cone from git 2.35; init has it since 2.25 (e.g. git 2.26 in the Docker image) and set keeps its mode
+            ["git", "-C", repo_folder, "sparse-checkout", "init", "--no-cone"],
+            ["git", "-C", repo_folder, "sparse-checkout", "set"] + sparse_patterns,
+            ["git", "-C", repo_folder, "checkout"],
+        ]
+
+    def fetch_from_mirror(self, run: ScanRun, repo_info: dict, repo_folder: str, commands: list) -> list:
+        """
+        Updates the bare mirror of a repository and exports the tip of its default branch into repo_folder. \n
+        With --incremental and a previous count, only the files changed since that count are exported, and their
+        paths (including deleted ones) are returned. Otherwise the whole tree is exported and None is returned.
+        The growth of the mirror is recorded as the fetched bytes, which is close to what was transferred.
+        """
+        repo_id = repo_info["id"]
+        mirror_path = get_mirror_path(self.mirror_dir, repo_id)
+        counted_sha = None
+        if self.incremental and os.path.exists(self.get_by_file_report_path(repo_id)):
+            counted_sha = read_local_head_sha(mirror_path, COUNTED_REF)
+            if counted_sha and read_counted_settings(mirror_path) != self.count_settings:
+                # the previous report was counted with other exclusions, so it may be missing files that are counted now
+                print(f"{counted_sha} was counted with different settings, counting the whole tree")
+                counted_sha = None
+        _, mirror_bytes_before = get_folder_size(mirror_path)
+        for command in get_mirror_fetch_commands(repo_info["clone_url"], repo_info["default_branch"], mirror_path):
+            command_full_string = shlex.join(command)
+            print(command_full_string)
+            commands.append(command_full_string)
+            run.rate_limiter.run(lambda: run_mirror_command(command), command_full_string, (MirrorError,), self.clone_retries)
+        _, mirror_bytes_after = get_folder_size(mirror_path)
+        run.run_profile.count("fetch_bytes", max(0, mirror_bytes_after - mirror_bytes_before), repo_id)
+        changed_paths = None
+        if counted_sha:
+            changed_files = get_changed_files(mirror_path, counted_sha)
+            if any(path.rpartition("/")[2] == IGNORE_FILE_NAME for _, path in changed_files):
+                # the set of excluded paths changed, so files that were left out before may have to be counted now
+                print(f"A {IGNORE_FILE_NAME} file changed since {counted_sha}, counting the whole tree")
+                counted_sha = None
+        if counted_sha:
+            changed_paths = [path for _, path in changed_files]
+            # the unchanged .clocignore files are exported as well, so the update applies the same exclusions as the previous count
+            export_paths = sorted({path for status, path in changed_files if status != "D"} | set(list_tree_files(mirror_path, IGNORE_FILE_NAME)))
+            file_count = export_mirror_tree(mirror_path, repo_folder, export_paths)
+            print(f"Incremental update from {counted_sha}: {len(changed_files)} changed files, exported {file_count} files from {mirror_path}")
+            run.run_profile.count("files_changed", len(changed_files), repo_id)
+        else:
+            file_count = export_mirror_tree(mirror_path, repo_folder)
+            print(f"Successfully exported {file_count} files from {mirror_path}")
+        run.run_profile.count("files_fetched", file_count, repo_id)
+        return changed_paths
+
+    def fetch_repo(self, run: ScanRun, repo_info: dict, repo_folder: str, commands: list) -> list:
+        """
+        Fetches the default branch of a repository into repo_folder using the selected fetch mode. \n
+        Records the fetched bytes and files in the run profile. Returns the changed paths of an incremental update,
+        or None if the whole tree was fetched.
+        """
+        repo_id = repo_info["id"]
+        clone_url = repo_info["clone_url"]
+        if self.mirror_dir:
+            return self.fetch_from_mirror(run, repo_info, repo_folder, commands)
+        if self.fetch_mode == 'archive':
+            archive_url = repo_info["archive_url"]
+            command_full_string = f"GET {archive_url}"
+            print(command_full_string)
+            commands.append(command_full_string)
+            file_count, downloaded_bytes = download_archive(self.fetch_session, archive_url, repo_folder, run.rate_limiter, **run.provider.get_request_kwargs())
+            print(f"Successfully unpacked {file_count} files from {archive_url}")
+            run.run_profile.count("fetch_bytes", downloaded_bytes, repo_id)
+            run.run_profile.count("files_fetched", file_count, repo_id)
+            return None
+        if self.fetch_mode == 'partial':
+            git_commands = self.get_partial_clone_commands(clone_url, repo_folder)
+        else:
+            git_commands = [["git", "clone", "--depth=1", clone_url, "--single-branch", repo_folder]]
+        for command_index, command in enumerate(git_commands):
+            command_full_string = shlex.join(command)
+            print(command_full_string)
+            commands.append(command_full_string)
+            # only the clone itself creates repo_folder, so only its retries need to clean up after a failed attempt
+            self.run_git_command(run, command, clone_url, repo_folder if command_index == 0 else None)
+        print(f"Successfully cloned {clone_url}")
+        # a shallow clone's object store is close to what was transferred
+        _, clone_bytes = get_folder_size(os.path.join(repo_folder, ".git"))
+        run.run_profile.count("fetch_bytes", clone_bytes, repo_id)
+        return None
+
+    def process_repo(self, run: ScanRun, index: int, repo_info: dict, commands: list):
+        """
+        Fetches, counts, and deletes a single repository. \n
+        Stores total_loc on the repo_info object and appends the commands that were run to commands.
+        """
+        # pull out all relevant information from the repo_info object all at once
+        repo_id = repo_info["id"]
+        repo_name = repo_info["repository_name"]
+        clone_url = repo_info["clone_url"]
+        default_branch = repo_info["default_branch"]
+        run_profile = run.run_profile
+
+        print(f"Processing repo {index}: {repo_name} - repo_id: {repo_id}")
+        # Reuse the previous result if the default branch has not moved
+        commit_sha = None
+        if self.scan_cache:
+            with run_profile.stage("cache_lookup", repo_id):
+                run.rate_limiter.acquire()
+                commit_sha = resolve_head_sha(clone_url, default_branch)
+            cached_entry = self.scan_cache.lookup(repo_id, commit_sha, **self.count_settings)
+            if cached_entry:
+                print(f"Using cached result for {repo_id} at commit {commit_sha}")
+                repo_info["total_loc"] = cached_entry["total_loc"]
+                repo_info["languages"] = cached_entry.get("languages")
+                return
+        # Fetch into a folder named after the repo id so concurrent repos with the same name do not collide
+        with run_profile.stage("scratch_wait", repo_id):
+            repo_folder = self.scratch_space.reserve(repo_id, repo_info["size_bytes"])
+        with self.clone_semaphore, run_profile.stage("fetch", repo_id):
+            changed_paths = self.fetch_repo(run, repo_info, repo_folder, commands)
+        if self.scratch_space.byte_budget:
+            _, used_bytes = get_folder_size(repo_folder)
+            self.scratch_space.record_usage(repo_id, used_bytes)
+        if self.scan_cache and self.mirror_dir:
+            commit_sha = read_local_head_sha(get_mirror_path(self.mirror_dir, repo_id), MIRROR_REF) or commit_sha
+        elif self.scan_cache and self.fetch_mode != 'archive':
+            # key the result on what was actually cloned in case the branch moved since ls-remote
+            commit_sha = read_local_head_sha(repo_folder) or commit_sha
+        languages = None
+        with self.count_semaphore, run_profile.stage("count", repo_id):
+            if self.engine == 'builtin':
+                languages, repo_total_loc = self.execute_builtin_count(run, repo_id, repo_folder, changed_paths)
+            else:
+                # Run go-cloc
+                # example: ./go-cloc --local-file-path {repo_name} --scan-id opencv --results-directory-path .dev/results/
+                # go-cloc only takes a directory, so excluded paths are deleted from the scratch copy first
+                deleted_count = PathFilter(repo_folder, self.exclude_patterns).delete_excluded_paths({".git"})
+                if deleted_count:
+                    print(f"Deleted {deleted_count} excluded files and directories from {repo_folder}")
+                command = [self.go_cloc_path, "--local-file-path", repo_folder, "--scan-id", repo_id, "--results-directory-path", self.output_dir]
+                command_full_string = shlex.join(command)
+                print(command_full_string)
+                commands.append(command_full_string)
+                repo_total_loc = execute_go_cloc(command)
+        # store the result in the repo_info object
+        repo_info["total_loc"] = repo_total_loc
+        repo_info["languages"] = languages
+        if self.mirror_dir and self.engine == 'builtin':
+            # the reports now describe the fetched tip, so the next incremental update can start from it
+            mark_counted(get_mirror_path(self.mirror_dir, repo_id), self.count_settings)
+        if self.scan_cache:
+            self.scan_cache.store(repo_id, commit_sha, repo_total_loc, languages, **self.count_settings)
+        # Delete folder in the background
+        with run_profile.stage("cleanup", repo_id):
+            self.scratch_space.release(repo_id)
+        # only repositories that were actually fetched and counted have a duration, cached results do not
+        repo_info["seconds"] = round(run_profile.get_repo_seconds(repo_id), 3)
+
+    def scan_repo(self, run: ScanRun, index: int, repo_info: dict):
+        """
+        Runs process_repo and records the outcome in the result journal as soon as the repository is done. \n
+        A failed repository is journaled and does not stop the rest of the scan.
+        """
+        repo_id = repo_info["id"]
+        if run.journal.is_completed(repo_id):
+            print(f"Skipping repo {index}: {repo_id} - already completed in a previous run")
+            run.run_profile.repo_skipped()
+            if run.on_result:
+                run.on_result({"repo_id": repo_id, "repository_name": repo_info["repository_name"], "status": "skipped"})
+            return
+        commands = []
+        entry = {"repo_id": repo_id, "repository_name": repo_info["repository_name"], "commands": commands}
+        # another scan may be processing the same repository, and both would fetch into the same folder
+        with self.get_repo_lock(repo_id):
+            try:
+                self.process_repo(run, index, repo_info, commands)
+                if repo_info["total_loc"] is None:
+                    entry.update({"status": "failed", "error": "Line counter did not report a total"})
+                else:
+                    entry.update({"status": "success", "total_loc": repo_info["total_loc"]})
+            except Exception as e:
+                if isinstance(e, (CloneError, ArchiveDownloadError, MirrorError, requests.RequestException, OSError)):
+                    print(f"Error: Failed to process {repo_id}. {e}")
+                    error = str(e)
+                else:
+                    # anything else (a corrupt tree, a broken count process, ...) still only fails this repository
+                    print(f"Error: Failed to process {repo_id}. Unexpected {type(e).__name__}: {e}")
+                    error = f"{type(e).__name__}: {e}"
+                entry.update({"status": "failed", "error": error})
+                # remove anything a failed clone or download left behind
+                self.scratch_space.release(repo_id)
+        run.journal.append(entry)
+        if self.results_store:
+            self.results_store.record_repo(run.run_id, repo_info, entry["status"], entry.get("total_loc"), repo_info.get("languages"), repo_info.get("seconds"))
+        run.run_profile.repo_completed(repo_id, entry.get("total_loc"))
+        if run.on_result:
+            run.on_result(entry)
+
+    def scan(self, devops: str, organization: str, access_token: str, use_http: bool = False, devops_base_url_override: str = None,
+             repositories: list = None, resume: bool = False, show_progress: bool = False, run_dir: str = None, commands_file_path: str = None,
+             on_result=None) -> dict:
+        """
+        Discovers the repositories of an organization and fetches and counts them, returning a summary of the scan. \n
+        repositories limits the scan to the given repository names or ids; listing stops early once every id was found.
+        Every result is journaled in run_dir (the output directory by default) and passed to on_result as soon as the
+        repository is done, from the worker thread that processed it. The combined CSV, the commands file (commands.txt in
+        run_dir by default), and run-profile.json are written once all repositories are done.
+        """
+        run_dir = run_dir or self.output_dir
+        os.makedirs(run_dir, exist_ok=True)
+        commands_file_path = commands_file_path or os.path.join(run_dir, "commands.txt")
+        journal_file_path = os.path.join(run_dir, f"{organization}-results-journal.jsonl")
+        run_profile = RunProfile(show_progress)
+        rate_limiter = self.get_rate_limiter(devops, devops_base_url_override)
+        provider = Provider(devops, organization, access_token, use_http, devops_base_url_override, self.discovery_session, rate_limiter, self.discovery_workers, run_profile)
+        run_id = None
+        if self.results_store:
+            run_id = self.results_store.start_run(organization, devops, resume)
+        run = ScanRun(provider, ResultJournal(journal_file_path, resume), on_result, run_id, self.blob_index.start_scan() if self.blob_index else None)
+        retries_before = rate_limiter.retries
+        throttled_responses_before = rate_limiter.throttled_responses
+        wanted_repositories = set(repositories or [])
+        remaining_repo_ids = set(wanted_repositories)
+        duration_estimator = None
+        if self.order == 'size':
+            # read before this scan replaces the run profile
+            durations = read_repo_durations(os.path.join(run_dir, "run-profile.json"))
+            if self.results_store:
+                durations.update(self.results_store.get_repo_durations(organization))
+            duration_estimator = DurationEstimator(durations)
+
+        # Process the repos in the worker pool as soon as they are discovered, so cloning starts while later pages are still being fetched.
+        # With --order size the workers take the longest of the repos discovered so far first, see PriorityExecutor.
+        # Each repo records its own result in the journal, so nothing is lost if the run is interrupted
+        discovery_error = None
+        futures = []
+        try:
+            index = 0
+            for repo_info in provider.discover_repositories():
+                if wanted_repositories and repo_info["id"] not in wanted_repositories and repo_info["repository_name"] not in wanted_repositories:
+                    continue
+                index += 1
+                print(json.dumps(repo_info, indent=4))
+                run_profile.repo_discovered()
+                estimated_seconds = duration_estimator.estimate(repo_info["id"], repo_info["size_bytes"]) if duration_estimator else 0
+                large = bool(self.large_repo_size) and repo_info["size_bytes"] >= self.large_repo_size
+                futures.append(self.executor.submit(estimated_seconds, self.scan_repo, run, index, repo_info, large=large))
+                remaining_repo_ids.discard(repo_info["id"])
+                if wanted_repositories and not remaining_repo_ids:
+                    break
+        except (DiscoveryError, requests.RequestException) as e:
+            # The repositories discovered so far are still scanned and journaled, so the run can be continued with --resume
+            print(f"Error: {e}. Finishing the {len(futures)} repositories discovered so far")
+            discovery_error = e
+        for future in futures:
+            future.result()
+        run.journal.close()
+        run_profile.count("retries", rate_limiter.retries - retries_before)
+        run_profile.count("throttled_responses", rate_limiter.throttled_responses - throttled_responses_before)
+        if run.blob_index:
+            run.blob_index.close()
+            run_profile.count("blob_lookups", run.blob_index.lookups)
+            run_profile.count("blob_hits", run.blob_index.hits)
+            run_profile.count("unique_loc", run.blob_index.unique_loc)
+
+        # Read back the outcome of every repo from the journal, including repos completed in a resumed run
+        repo_statuses = {}
+        # Write out the commands that were run to a file
+        with open(commands_file_path, "w") as f:
+            for entry in read_journal(journal_file_path):
+                repo_statuses[entry["repo_id"]] = entry["status"]
+                for command in entry["commands"]:
+                    f.write(f"{command}\n")
+        print(f"Commands that were run are written to {commands_file_path}")
+
+        # Write out the repo info to a file using os separator, sorted by total_loc descending
+        # ties are broken by repo id so the output does not depend on completion order
+        combined_csv_output_path = os.path.join(run_dir, f"AAA-{organization}-combined-total-lines.csv")
+        with run_profile.stage("aggregate"):
+            total_loc_count = merge_journal_into_csv(journal_file_path, combined_csv_output_path)
+        print(f"Combined total LOC can be found in {combined_csv_output_path}")
+        run_profile_path = os.path.join(run_dir, "run-profile.json")
+        run_profile.write(run_profile_path)
+        success_repos = [repo_id for repo_id, status in repo_statuses.items() if status == "success"]
+        failed_repos = [repo_id for repo_id, status in repo_statuses.items() if status != "success"]
+        if self.results_store:
+            # only a run that discovered every repository tells which repositories no longer exist
+            self.results_store.finish_run(run_id, not wanted_repositories and discovery_error is None, len(success_repos), len(failed_repos), total_loc_count)
+        return {
+            "organization": organization,
+            "success_repos": success_repos,
+            "failed_repos": failed_repos,
+            "total_loc": total_loc_count,
+            "discovery_error": str(discovery_error) if discovery_error else None,
+            "journal_file_path": journal_file_path,
+            "combined_csv_path": combined_csv_output_path,
+            "commands_file_path": commands_file_path,
+            "run_profile_path": run_profile_path,
+            # with --dedupe, the lines of code of this scan with every distinct file counted once, and how many files were already in the blob index
+            "unique_loc": run.blob_index.unique_loc if run.blob_index else None,
+            "blob_hits": run.blob_index.hits if run.blob_index else None,
+            "blob_lookups": run.blob_index.lookups if run.blob_index else None,
+        }
+
+    def close(self):
+        """
+        Waits for the background deletes to finish and releases the pools, sessions, blob index, and results store
+        """
+        self.executor.shutdown()
+        self.scratch_space.close()
+        if self.count_process_pool:
+            self.count_process_pool.shutdown()
+        self.discovery_session.close()
+        self.fetch_session.close()
+        if self.blob_index:
+            self.blob_index.close()
+        if self.results_store:
+            self.results_store.close()
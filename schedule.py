@@ -0,0 +1,85 @@
+import heapq
+import itertools
+import threading
+from concurrent.futures import Future
+
+# Throughput assumed for fetching and counting a repository until a repository with a known duration calibrates it
+DEFAULT_BYTES_PER_SECOND = 20 * 1024 ** 2
+
+class DurationEstimator:
+    """
+    Estimates how long a repository will take to fetch and count, so the longest ones can be started first. \n
+    A repository that was processed before is estimated by how long it took then. Any other is estimated from the size
+    the DevOps platform reports, at the throughput the repositories with a known duration achieved so far.
+    """
+    def __init__(self, durations: dict = None):
+        self.durations = durations or {}
+        self.known_seconds = 0.0
+        self.known_bytes = 0
+
+    def estimate(self, repo_id: str, size_bytes: int) -> float:
+        seconds = self.durations.get(repo_id)
+        if seconds is not None:
+            if size_bytes:
+                self.known_seconds += seconds
+                self.known_bytes += size_bytes
+            return seconds
+        if self.known_bytes and self.known_seconds:
+            return size_bytes * self.known_seconds / self.known_bytes
+        return size_bytes / DEFAULT_BYTES_PER_SECOND
+
+class PriorityExecutor:
+    """
+    Worker threads that always start the pending job with the highest cost, instead of the one submitted first. \n
+    Starting the longest repositories first keeps a large repository that happens to be discovered last from running
+    alone at the end while every other worker is idle. Jobs submitted as large run on a separate lane of large_workers
+    threads, so a few oversized repositories never occupy all regular workers, and at most large_workers of them take
+    up scratch space and memory at the same time. Jobs of equal cost run in submission order.
+    """
+    def __init__(self, workers: int, large_workers: int = 0):
+        self.condition = threading.Condition()
+        self.queues = {False: [], True: []}
+        self.sequence = itertools.count()
+        self.shutting_down = False
+        self.large_workers = large_workers
+        self.threads = [threading.Thread(target=self.work, args=(large,), daemon=True)
+                        for large, count in ((False, workers), (True, large_workers)) for _ in range(count)]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, cost: float, fn, *args, large: bool = False) -> Future:
+        """
+        Queues fn(*args) and returns a Future for its result. large requires the executor to have large_workers.
+        """
+        if large and not self.large_workers:
+            raise ValueError("Large jobs require an executor with large_workers")
+        future = Future()
+        with self.condition:
+            heapq.heappush(self.queues[large], (-cost, next(self.sequence), future, fn, args))
+            self.condition.notify_all()
+        return future
+
+    def work(self, large: bool):
+        queue = self.queues[large]
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: queue or self.shutting_down)
+                if not queue:
+                    return
+                _, _, future, fn, args = heapq.heappop(queue)
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn(*args))
+            except BaseException as e:
+                future.set_exception(e)
+
+    def shutdown(self):
+        """
+        Waits for the queued jobs to finish and stops the worker threads
+        """
+        with self.condition:
+            self.shutting_down = True
+            self.condition.notify_all()
+        for thread in self.threads:
+            thread.join()
@@ -0,0 +1,111 @@
+import os
+import shutil
+import stat
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Prefix of folders that are being deleted in the background
+DELETING_PREFIX = ".deleting-"
+SIZE_SUFFIXES = {"k": 1024, "m": 1024 ** 2, "g": 1024 ** 3, "t": 1024 ** 4}
+
+def parse_size(value: str) -> int:
+    """
+    Parses a size like 500m, 20g or 1.5G into bytes. A plain number is taken as bytes.
+    """
+    value = value.strip().lower().removesuffix("b")
+    multiplier = SIZE_SUFFIXES.get(value[-1:])
+    if multiplier:
+        value = value[:-1]
+    return int(float(value) * (multiplier or 1))
+
+# Needed for Windows to delete git object files
+def make_writable_and_delete(func, path, _):
+    os.chmod(path, stat.S_IWRITE)
+    func(path)
+
+class ScratchSpace:
+    """
+    Hands out a working folder per repository under root_path and keeps their total size within byte_budget. \n
+    A repository reserves its estimated size before it is fetched; when the reservations would exceed the budget, it
+    waits until other repositories release theirs. A single repository larger than the budget still runs, alone.
+    Released folders are renamed out of the way and deleted in a background thread, so deleting large trees is not
+    on the critical path. Their space is returned to the budget once they are actually gone.
+    """
+    def __init__(self, root_path: str, byte_budget: int = None):
+        self.root_path = root_path
+        self.byte_budget = byte_budget
+        self.condition = threading.Condition()
+        self.reserved_bytes = {}
+        self.cleanup_executor = ThreadPoolExecutor(max_workers=1)
+        os.makedirs(root_path, exist_ok=True)
+        # folders a previous run did not get to delete
+        for name in os.listdir(root_path):
+            if name.startswith(DELETING_PREFIX):
+                self.cleanup_executor.submit(self.delete, None, os.path.join(root_path, name))
+
+    def get_folder(self, repo_id: str) -> str:
+        return os.path.join(self.root_path, repo_id)
+
+    def reserve(self, repo_id: str, estimated_bytes: int) -> str:
+        """
+        Blocks until estimated_bytes fit into the budget and returns the folder of the repository. \n
+        A folder left behind by an interrupted run is moved aside and deleted in the background, so archive and mirror
+        exports, which unpack into an existing folder, never count its stale files.
+        """
+        with self.condition:
+            if self.byte_budget:
+                self.condition.wait_for(lambda: not self.reserved_bytes or sum(self.reserved_bytes.values()) + estimated_bytes <= self.byte_budget)
+            self.reserved_bytes[repo_id] = estimated_bytes
+        folder_path = self.get_folder(repo_id)
+        if os.path.exists(folder_path):
+            print(f"Deleting {folder_path} left behind by a previous run")
+            # the stale folder was never reserved, so deleting it returns nothing to the budget
+            self.cleanup_executor.submit(self.delete, None, self.move_aside(repo_id))
+        return folder_path
+
+    def record_usage(self, repo_id: str, used_bytes: int):
+        """
+        Replaces the estimate of a repository with the size it actually takes up once it is fetched
+        """
+        with self.condition:
+            if repo_id in self.reserved_bytes:
+                self.reserved_bytes[repo_id] = used_bytes
+                self.condition.notify_all()
+
+    def release(self, repo_id: str):
+        """
+        Deletes the folder of a repository in the background and returns its reservation once it is gone
+        """
+        folder_path = self.get_folder(repo_id)
+        if not os.path.exists(folder_path):
+            self.return_reservation(repo_id)
+            return
+        self.cleanup_executor.submit(self.delete, repo_id, self.move_aside(repo_id))
+
+    def move_aside(self, repo_id: str) -> str:
+        """
+        Renames the folder of a repository out of the way, so it can be fetched again while the old one is deleted
+        """
+        deleting_path = os.path.join(self.root_path, f"{DELETING_PREFIX}{repo_id}-{uuid.uuid4().hex[:8]}")
+        os.rename(self.get_folder(repo_id), deleting_path)
+        return deleting_path
+
+    def delete(self, repo_id: str, folder_path: str):
+        try:
+            shutil.rmtree(folder_path, onerror=make_writable_and_delete)
+        except OSError as e:
+            print(f"Error: Unable to delete {folder_path}. {e}")
+        if repo_id is not None:
+            self.return_reservation(repo_id)
+
+    def return_reservation(self, repo_id: str):
+        with self.condition:
+            self.reserved_bytes.pop(repo_id, None)
+            self.condition.notify_all()
+
+    def close(self):
+        """
+        Waits for the background deletes to finish
+        """
+        self.cleanup_executor.shutdown(wait=True)
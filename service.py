@@ -0,0 +1,152 @@
+import argparse
+import json
+import os
+import queue
+import signal
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from scanner import Scanner, add_scan_arguments, create_scanner_from_args
+
+# Fields a scan job must have, and the optional ones with their defaults. There is no resume: every job has a run
+# folder of its own, so there is no earlier journal to continue from
+REQUIRED_JOB_FIELDS = ("devops", "organization", "access_token")
+OPTIONAL_JOB_FIELDS = {"use_http": False, "devops_base_url_override": None, "repositories": None}
+
+parser = argparse.ArgumentParser(description='Long-running local service that scans DevOps organizations on request. Connections, worker threads, and count processes stay warm between scan jobs.')
+
+# Add arguments
+parser.add_argument('--host', type=str, help="Address to listen on. Default is '127.0.0.1'", required=False, default='127.0.0.1')
+parser.add_argument('--port', type=int, help='Port to listen on. Default is 8080', required=False, default=8080)
+add_scan_arguments(parser)
+
+class ScanService(ThreadingHTTPServer):
+    """
+    Local HTTP/JSON service that runs scan jobs on a single Scanner, so its connections, worker threads, and count
+    processes stay warm between jobs. \n
+    POST /scans with a JSON job streams one JSON line per repository as soon as it is done, followed by a summary line.
+    GET /health reports the jobs that are running.
+    """
+    daemon_threads = True
+
+    def __init__(self, server_address: tuple, scanner: Scanner):
+        super().__init__(server_address, ScanServiceHandler)
+        self.scanner = scanner
+        self.lock = threading.Lock()
+        self.jobs_started = 0
+        self.jobs_running = 0
+
+    def start_job(self) -> str:
+        with self.lock:
+            self.jobs_started += 1
+            self.jobs_running += 1
+            return f"{time.strftime('%Y%m%d-%H%M%S')}-{self.jobs_started}"
+
+    def finish_job(self):
+        with self.lock:
+            self.jobs_running -= 1
+
+class ScanServiceHandler(BaseHTTPRequestHandler):
+    def send_json(self, status_code: int, payload: dict):
+        body = json.dumps(payload).encode()
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != "/health":
+            return self.send_json(404, {"error": f"Unknown path {self.path}"})
+        with self.server.lock:
+            self.send_json(200, {"status": "ok", "jobs_started": self.server.jobs_started, "jobs_running": self.server.jobs_running})
+
+    def read_job(self) -> dict:
+        """
+        Reads the scan job from the request body. Raises ValueError if it is not a valid job.
+        """
+        try:
+            job = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Request body is not valid JSON. {e}")
+        if not isinstance(job, dict):
+            raise ValueError("Request body must be a JSON object")
+        missing_fields = [name for name in REQUIRED_JOB_FIELDS if not job.get(name)]
+        if missing_fields:
+            raise ValueError(f"Missing required fields: {', '.join(missing_fields)}")
+        unknown_fields = set(job) - set(REQUIRED_JOB_FIELDS) - set(OPTIONAL_JOB_FIELDS)
+        if unknown_fields:
+            raise ValueError(f"Unknown fields: {', '.join(sorted(unknown_fields))}")
+        if job.get("repositories") is not None and not isinstance(job["repositories"], list):
+            raise ValueError("repositories must be a list of repository names or ids")
+        return {**OPTIONAL_JOB_FIELDS, **job}
+
+    def write_line(self, payload: dict) -> bool:
+        """
+        Writes one JSON line of the response. Returns False once the client has gone away.
+        """
+        try:
+            self.wfile.write((json.dumps(payload) + "\n").encode())
+            self.wfile.flush()
+            return True
+        except (BrokenPipeError, ConnectionResetError):
+            return False
+
+    def do_POST(self):
+        if self.path != "/scans":
+            return self.send_json(404, {"error": f"Unknown path {self.path}"})
+        try:
+            job = self.read_job()
+        except ValueError as e:
+            return self.send_json(400, {"error": str(e)})
+        scanner = self.server.scanner
+        job_id = self.server.start_job()
+        # the response has no length up front, so it ends when the connection is closed after the summary
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Connection", "close")
+        self.end_headers()
+
+        # results arrive from the scanner's worker threads, so they are handed over to this thread to be written in order
+        results = queue.Queue()
+        def run_job():
+            try:
+                summary = scanner.scan(job["devops"], job["organization"], job["access_token"], job["use_http"], job["devops_base_url_override"],
+                                       job["repositories"], run_dir=os.path.join(scanner.output_dir, "jobs", job_id),
+                                       # the commands hold clone urls with the access token, so they stay in the job's commands file
+                                       on_result=lambda entry: results.put({"type": "result", **{name: value for name, value in entry.items() if name != "commands"}}))
+                results.put({"type": "summary", "job_id": job_id, **summary})
+            except Exception as e:
+                print(f"Error: Scan job {job_id} failed. {e}")
+                results.put({"type": "error", "job_id": job_id, "error": str(e)})
+            finally:
+                self.server.finish_job()
+                results.put(None)
+        job_thread = threading.Thread(target=run_job, daemon=True)
+        job_thread.start()
+        client_connected = self.write_line({"type": "started", "job_id": job_id})
+        while True:
+            line = results.get()
+            if line is None:
+                break
+            # a client that disconnects does not cancel the job; its results are still journaled in the job's folder
+            if client_connected:
+                client_connected = self.write_line(line)
+        job_thread.join()
+
+if __name__ == "__main__":
+    # Parse the arguments
+    args = parser.parse_args()
+    # Creates the count process pool before the server starts any threads
+    scanner = create_scanner_from_args(args, parser)
+    server = ScanService((args.host, args.port), scanner)
+    # shutdown() waits for serve_forever() to return, so it can not be called from the signal handler on the main thread
+    signal.signal(signal.SIGTERM, lambda signal_number, frame: threading.Thread(target=server.shutdown).start())
+    print(f"Listening on http://{args.host}:{server.server_address[1]}. POST scan jobs to /scans")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        scanner.close()
@@ -0,0 +1,62 @@
+import io
+import ntpath
+import os
+import tarfile
+from types import SimpleNamespace
+import pytest
+import fetch
+from fetch import extract_tar_stream, resolve_member_path
+
+@pytest.mark.parametrize("member_name, strip_components, expected", [
+    ("repo-main/src/a.py", 1, "src/a.py"),
+    ("./repo-main/./src//a.py", 1, "src/a.py"),
+    ("src/a.py", 0, "src/a.py"),
+    ("repo-main\\src\\a.py", 1, "src/a.py"),
+    # only the top level folder itself
+    ("repo-main/", 1, None),
+    # traversal
+    ("repo-main/../../etc/passwd", 1, None),
+    ("repo-main/src/../../x", 1, None),
+    ("..\\..\\x", 0, None),
+    ("repo-main\\..\\..\\x", 1, None),
+    # absolute paths
+    ("/etc/passwd", 0, None),
+    ("/repo-main/etc/passwd", 1, None),
+    # drive letters, which survive stripping the top level folder
+    ("repo-main/C:/Windows/x", 1, None),
+    ("C:\\Windows\\x", 0, None),
+    ("repo-main\\C:\\Windows\\x", 1, None),
+    ("repo-main/src/file:stream", 1, None),
+])
+def test_resolve_member_path(tmp_path, member_name, strip_components, expected):
+    member_path = resolve_member_path(str(tmp_path), member_name, strip_components)
+    if expected is None:
+        assert member_path is None
+    else:
+        assert member_path == os.path.join(str(tmp_path), *expected.split("/"))
+
+@pytest.mark.parametrize("member_name, expected", [
+    ("repo-main/src/a.py", "C:\\scratch\\repo\\src\\a.py"),
+    # ntpath.join("C:\\scratch\\repo", "C:", "Windows") is C:Windows, outside the scratch folder
+    ("repo-main/C:/Windows/x", None),
+    ("repo-main/D:/x", None),
+    # empty parts are dropped, so a UNC prefix stays inside
+    ("repo-main/\\\\server\\share/x", "C:\\scratch\\repo\\server\\share\\x"),
+])
+def test_resolve_member_path_on_windows(monkeypatch, member_name, expected):
+    monkeypatch.setattr(fetch, "os", SimpleNamespace(path=ntpath))
+    assert resolve_member_path("C:\\scratch\\repo", member_name, 1) == expected
+
+def test_extract_tar_stream_skips_members_outside_the_destination(tmp_path):
+    archive = io.BytesIO()
+    with tarfile.open(fileobj=archive, mode="w:gz") as tar:
+        for name in ["repo-main/src/a.py", "repo-main/../escaped.py", "repo-main/C:/escaped.py", "/abs/escaped.py"]:
+            content = b"x = 1\n"
+            member = tarfile.TarInfo(name)
+            member.size = len(content)
+            tar.addfile(member, io.BytesIO(content))
+    archive.seek(0)
+    destination_folder = tmp_path / "scratch" / "repo"
+    assert extract_tar_stream(archive, str(destination_folder)) == 1
+    assert sorted(os.listdir(tmp_path)) == ["scratch"]
+    assert os.listdir(destination_folder) == ["src"]
@@ -0,0 +1,68 @@
+import os
+import shutil
+import subprocess
+from types import SimpleNamespace
+import pytest
+from mirror import get_mirror_path, mark_counted, read_counted_settings
+from rate_limit import RateLimiter
+from run_profile import RunProfile
+from scan_cache import get_count_settings
+from scanner import Scanner
+
+def git(repo_path, *args):
+    subprocess.run(["git", "-C", repo_path, "-c", "user.name=test", "-c", "user.email=test@example.com"] + list(args), check=True, capture_output=True)
+
+def write_file(root_path, relative_path: str, content: str):
+    file_path = os.path.join(root_path, *relative_path.split("/"))
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, "w") as f:
+        f.write(content)
+
+@pytest.fixture
+def source_repo(tmp_path):
+    repo_path = str(tmp_path / "source")
+    os.makedirs(repo_path)
+    git(repo_path, "init", "--quiet", "--initial-branch=main")
+    write_file(repo_path, "src/a.py", "x = 1\ny = 2\n")
+    write_file(repo_path, "vendor/b.py", "x = 1\ny = 2\nz = 3\n")
+    git(repo_path, "add", "-A")
+    git(repo_path, "commit", "--quiet", "-m", "first")
+    return repo_path
+
+def count(tmp_path, source_repo: str, exclude_patterns: list) -> tuple:
+    """
+    Fetches and counts the source repository the way process_repo does with --mirror_dir --incremental. \n
+    Returns (changed_paths, total_loc).
+    """
+    scanner = Scanner(output_dir=str(tmp_path / "output"), engine="builtin", mirror_dir=str(tmp_path / "mirrors"), incremental=True,
+                      exclude_patterns=exclude_patterns, scratch_dir=str(tmp_path / "scratch"))
+    try:
+        run = SimpleNamespace(rate_limiter=RateLimiter(), run_profile=RunProfile(), blob_index=None)
+        repo_info = {"id": "repo", "clone_url": source_repo, "default_branch": "main"}
+        repo_folder = str(tmp_path / "scratch" / "repo")
+        shutil.rmtree(repo_folder, ignore_errors=True)
+        changed_paths = scanner.fetch_from_mirror(run, repo_info, repo_folder, [])
+        _, total_loc = scanner.execute_builtin_count(run, "repo", repo_folder, changed_paths)
+        mark_counted(get_mirror_path(scanner.mirror_dir, "repo"), scanner.count_settings)
+        return changed_paths, total_loc
+    finally:
+        scanner.close()
+
+def test_incremental_update_with_the_same_settings(tmp_path, source_repo):
+    assert count(tmp_path, source_repo, ["vendor/"]) == (None, 2)
+    write_file(source_repo, "src/c.py", "x = 1\n")
+    git(source_repo, "add", "-A")
+    git(source_repo, "commit", "--quiet", "-m", "second")
+    assert count(tmp_path, source_repo, ["vendor/"]) == (["src/c.py"], 3)
+
+def test_changed_exclusions_count_the_whole_tree(tmp_path, source_repo):
+    assert count(tmp_path, source_repo, ["vendor/"]) == (None, 2)
+    # vendor/b.py is missing from the previous report, so only a full count can include it
+    assert count(tmp_path, source_repo, []) == (None, 5)
+    assert read_counted_settings(get_mirror_path(str(tmp_path / "mirrors"), "repo")) == get_count_settings("builtin", [])
+
+def test_unknown_settings_count_the_whole_tree(tmp_path, source_repo):
+    count(tmp_path, source_repo, [])
+    # e.g. a mirror counted before the settings were recorded
+    os.remove(get_mirror_path(str(tmp_path / "mirrors"), "repo") + ".counted.json")
+    assert count(tmp_path, source_repo, []) == (None, 5)
@@ -0,0 +1,86 @@
+import csv
+import json
+import random
+import pytest
+import journal
+from journal import ResultJournal, merge_journal_into_csv, read_journal
+
+def success(repo_id: str, total_loc: int) -> dict:
+    return {"repo_id": repo_id, "status": "success", "total_loc": total_loc}
+
+def failure(repo_id: str) -> dict:
+    return {"repo_id": repo_id, "status": "failed", "total_loc": None, "error": "clone failed"}
+
+def write_journal(journal_file_path, entries: list, resume: bool = False):
+    result_journal = ResultJournal(str(journal_file_path), resume)
+    for entry in entries:
+        result_journal.append(entry)
+    result_journal.close()
+    return result_journal
+
+def read_csv(csv_file_path) -> list:
+    with open(csv_file_path, newline='') as f:
+        return list(csv.reader(f))
+
+def test_truncated_trailing_line_is_ignored(tmp_path):
+    journal_file_path = tmp_path / "journal.jsonl"
+    write_journal(journal_file_path, [success("a", 10), success("b", 20)])
+    # a crash in the middle of writing the next entry
+    with open(journal_file_path, "a") as f:
+        f.write(json.dumps(success("c", 30))[:20])
+    assert [entry["repo_id"] for entry in read_journal(str(journal_file_path))] == ["a", "b"]
+    assert merge_journal_into_csv(str(journal_file_path), str(tmp_path / "out.csv")) == 30
+
+def test_resume_after_a_truncated_line_keeps_new_entries(tmp_path):
+    journal_file_path = tmp_path / "journal.jsonl"
+    write_journal(journal_file_path, [success("a", 10)])
+    with open(journal_file_path, "a") as f:
+        f.write(json.dumps(success("b", 20))[:20])
+    write_journal(journal_file_path, [success("b", 20)], resume=True)
+    assert [entry["repo_id"] for entry in read_journal(str(journal_file_path))] == ["a", "b"]
+
+def test_resume_skips_completed_and_retries_failed_repositories(tmp_path):
+    journal_file_path = tmp_path / "journal.jsonl"
+    write_journal(journal_file_path, [success("a", 10), failure("b")])
+    result_journal = ResultJournal(str(journal_file_path), resume=True)
+    assert result_journal.is_completed("a")
+    assert not result_journal.is_completed("b")
+    result_journal.append(success("b", 20))
+    result_journal.close()
+    csv_file_path = tmp_path / "out.csv"
+    assert merge_journal_into_csv(str(journal_file_path), str(csv_file_path)) == 30
+    assert read_csv(csv_file_path) == [["repo_id", "code"], ["b", "20"], ["a", "10"]]
+
+def test_without_resume_the_journal_starts_over(tmp_path):
+    journal_file_path = tmp_path / "journal.jsonl"
+    write_journal(journal_file_path, [success("a", 10)])
+    result_journal = write_journal(journal_file_path, [success("b", 20)])
+    assert not result_journal.is_completed("a")
+    assert [entry["repo_id"] for entry in read_journal(str(journal_file_path))] == ["b"]
+
+def test_duplicate_successes_give_one_row(tmp_path):
+    journal_file_path = tmp_path / "journal.jsonl"
+    write_journal(journal_file_path, [success("a", 10), failure("a"), success("a", 10)])
+    csv_file_path = tmp_path / "out.csv"
+    assert merge_journal_into_csv(str(journal_file_path), str(csv_file_path)) == 10
+    assert read_csv(csv_file_path) == [["repo_id", "code"], ["a", "10"]]
+
+def test_ties_are_ordered_by_repo_id(tmp_path):
+    journal_file_path = tmp_path / "journal.jsonl"
+    write_journal(journal_file_path, [success("c", 5), success("a", 5), success("d", 7), success("b", 5), success("e", None)])
+    csv_file_path = tmp_path / "out.csv"
+    assert merge_journal_into_csv(str(journal_file_path), str(csv_file_path)) == 22
+    assert read_csv(csv_file_path) == [["repo_id", "code"], ["d", "7"], ["a", "5"], ["b", "5"], ["c", "5"], ["e", "0"]]
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 1000])
+def test_chunked_merge_matches_an_in_memory_sort(tmp_path, monkeypatch, chunk_size):
+    monkeypatch.setattr(journal, "MERGE_CHUNK_SIZE", chunk_size)
+    generator = random.Random(chunk_size)
+    entries = [success(f"repo-{index:03d}", generator.randint(0, 20)) for index in range(100)]
+    journal_file_path = tmp_path / "journal.jsonl"
+    write_journal(journal_file_path, entries)
+    csv_file_path = tmp_path / "out.csv"
+    total_loc = merge_journal_into_csv(str(journal_file_path), str(csv_file_path))
+    expected = sorted(entries, key=lambda entry: (-entry["total_loc"], entry["repo_id"]))
+    assert total_loc == sum(entry["total_loc"] for entry in entries)
+    assert read_csv(csv_file_path)[1:] == [[entry["repo_id"], str(entry["total_loc"])] for entry in expected]
@@ -0,0 +1,42 @@
+import os
+import pytest
+from line_counter import count_lines, count_tree, update_counts
+
+def to_lines(text: str) -> list:
+    return [line.encode() for line in text.split("\n")]
+
+@pytest.mark.parametrize("language, text, expected", [
+    # (blank, comment, code), like cloc
+    ("Python", "import os\n\n# comment\nx = 1  # trailing comment", (1, 1, 2)),
+    ("Python", '"""\nModule docstring\n"""\nx = "not a comment"', (0, 3, 1)),
+    ("C", "/* block\n * comment\n */\nint x; /* trailing */\n// line", (0, 4, 1)),
+    ("C", "int x; /* opens\nstill comment */ int y;", (0, 0, 2)),
+    ("C", "/* a */ /* b */\n/* c */ int z;", (0, 1, 1)),
+    # --[[ must open a block, not start a -- line comment
+    ("Lua", "--[[\nblock\nstill block\n]]\nprint(1)", (0, 4, 1)),
+    ("Lua", "-- line comment\nx = 1 -- trailing", (0, 1, 1)),
+    ("Lua", "x = 1 --[[ inline ]] y = 2", (0, 0, 1)),
+])
+def test_count_lines(language, text, expected):
+    assert count_lines(to_lines(text), language) == expected
+
+def test_count_tree_skips_excluded_and_unknown_files(tmp_path):
+    files = {"a.py": "x = 1\ny = 2\n", "b.min.js": "var a;\n", "notes.txt": "text\n", "vendor/c.go": "package c\n", ".git/d.py": "x = 1\n"}
+    for relative_path, content in files.items():
+        os.makedirs(os.path.dirname(os.path.join(tmp_path, relative_path)), exist_ok=True)
+        with open(os.path.join(tmp_path, relative_path), "w") as f:
+            f.write(content)
+    with open(os.path.join(tmp_path, ".clocignore"), "w") as f:
+        f.write("vendor/\n")
+    languages, by_file = count_tree(str(tmp_path), exclude_patterns=["*.min.js"])
+    assert languages == {"Python": {"files": 1, "blank": 0, "comment": 0, "code": 2}}
+    assert by_file == [("a.py", "Python", 0, 0, 2)]
+
+def test_update_counts_applies_exclusions_to_previous_rows(tmp_path):
+    os.makedirs(os.path.join(tmp_path, "src"))
+    with open(os.path.join(tmp_path, "src", "new.py"), "w") as f:
+        f.write("x = 1\n")
+    previous_by_file = [("src/old.py", 0, 0, 3), ("gen/made.py", 0, 0, 10), ("src/gone.py", 0, 0, 4)]
+    languages, by_file = update_counts(previous_by_file, str(tmp_path), ["src/new.py", "src/gone.py"], exclude_patterns=["gen/"])
+    assert sorted(by_file) == [("src/new.py", "Python", 0, 0, 1), ("src/old.py", "Python", 0, 0, 3)]
+    assert languages["Python"]["code"] == 4
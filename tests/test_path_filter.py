@@ -0,0 +1,78 @@
+import os
+import pytest
+from path_filter import IGNORE_FILE_NAME, PathFilter
+
+def write_file(root_path, relative_path: str, content: str = "x = 1\n"):
+    file_path = os.path.join(root_path, *relative_path.split("/"))
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, "w") as f:
+        f.write(content)
+
+@pytest.mark.parametrize("patterns, relative_path, excluded", [
+    # a pattern without a slash matches at any depth
+    (["*.min.js"], "app.min.js", True),
+    (["*.min.js"], "web/static/app.min.js", True),
+    (["*.min.js"], "web/static/app.js", False),
+    # a trailing slash only matches directories, and excludes everything below them
+    (["node_modules/"], "web/node_modules/left-pad/index.js", True),
+    (["node_modules/"], "node_modules", False),
+    # a leading or inner slash anchors the pattern to the root
+    (["/vendor"], "vendor/lib.go", True),
+    (["/vendor"], "src/vendor/lib.go", False),
+    (["docs/api"], "docs/api/index.py", True),
+    (["docs/api"], "src/docs/api/index.py", False),
+    # ** matches across directories
+    (["**/generated/*.py"], "generated/a.py", True),
+    (["**/generated/*.py"], "src/deep/generated/a.py", True),
+    (["src/**/*.pb.go"], "src/a/b/c.pb.go", True),
+    (["src/**/*.pb.go"], "other/c.pb.go", False),
+    (["build/**"], "build/out/a.c", True),
+    # * and ? do not match a slash
+    (["src/*.py"], "src/a/b.py", False),
+    (["?.py"], "a.py", True),
+    (["?.py"], "ab.py", False),
+    # character classes, including negated ones
+    (["test[0-9].py"], "test7.py", True),
+    (["test[!0-9].py"], "test7.py", False),
+    # the last matching pattern decides, so ! re-includes a file
+    (["*.js", "!keep.js"], "web/keep.js", False),
+    (["*.js", "!keep.js"], "web/drop.js", True),
+    # but not once a parent directory is excluded, like git
+    (["vendor/", "!vendor/keep.go"], "vendor/keep.go", True),
+    # blank lines and comments are ignored, \# matches a literal #
+    (["", "# *.py"], "a.py", False),
+    (["\\#notes.md"], "#notes.md", True),
+])
+def test_is_excluded(tmp_path, patterns, relative_path, excluded):
+    assert PathFilter(str(tmp_path), patterns).is_excluded(relative_path) == excluded
+
+def test_clocignore_files_apply_below_their_directory(tmp_path):
+    write_file(tmp_path, IGNORE_FILE_NAME, "*.gen.py\n!keep.gen.py\n")
+    write_file(tmp_path, f"lib/{IGNORE_FILE_NAME}", "/fixtures/\n")
+    path_filter = PathFilter(str(tmp_path), ["*.log"])
+    assert path_filter.is_excluded("a.gen.py")
+    assert not path_filter.is_excluded("keep.gen.py")
+    assert path_filter.is_excluded("debug.log")
+    # anchored to lib, where the .clocignore is
+    assert path_filter.is_excluded("lib/fixtures/data.py")
+    assert not path_filter.is_excluded("fixtures/data.py")
+
+def test_walk_prunes_excluded_directories(tmp_path):
+    write_file(tmp_path, IGNORE_FILE_NAME, "vendor/\n")
+    for relative_path in ["src/a.py", "src/b.min.js", "vendor/dep/c.go", ".git/config", "web/node_modules/d.js"]:
+        write_file(tmp_path, relative_path)
+    path_filter = PathFilter(str(tmp_path), ["*.min.js", "node_modules/"])
+    walked = {}
+    for _, relative_directory, file_names in path_filter.walk({".git"}):
+        walked[relative_directory] = sorted(file_names)
+    # ignore files are never yielded, and excluded or skipped directories are never entered
+    assert walked == {"": [], "src": ["a.py"], "web": []}
+    assert path_filter.excluded_count == 3
+
+def test_delete_excluded_paths(tmp_path):
+    for relative_path in ["src/a.py", "src/b.min.js", "vendor/c.go"]:
+        write_file(tmp_path, relative_path)
+    deleted_count = PathFilter(str(tmp_path), ["*.min.js", "vendor/"]).delete_excluded_paths()
+    assert deleted_count == 2
+    assert sorted(os.listdir(tmp_path)) == ["src"]
+    assert os.listdir(os.path.join(tmp_path, "src")) == ["a.py"]
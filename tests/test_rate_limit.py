@@ -0,0 +1,183 @@
+import email.utils
+from types import SimpleNamespace
+import pytest
+import requests
+from requests.structures import CaseInsensitiveDict
+import rate_limit
+from rate_limit import EPOCH_THRESHOLD, RateLimiter, parse_retry_after
+
+class FakeClock:
+    """
+    Stands in for the time module: sleeping advances the clock instead of blocking, and every sleep is recorded
+    """
+    def __init__(self, now: float = 1700000000.0):
+        self.now = now
+        self.sleeps = []
+
+    def time(self) -> float:
+        return self.now
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.sleeps.append(seconds)
+        self.now += max(0.0, seconds)
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limit, "time", clock)
+    # the longest backoff of every attempt, so the waits are predictable
+    monkeypatch.setattr(rate_limit.random, "uniform", lambda low, high: high)
+    return clock
+
+def make_response(status_code: int = 200, **headers):
+    return SimpleNamespace(status_code=status_code, headers=CaseInsensitiveDict(headers), close=lambda: None)
+
+class FakeSend:
+    """
+    Returns the given responses (or raises the given exceptions) in order, like session.get
+    """
+    def __init__(self, *results):
+        self.results = list(results)
+        self.calls = 0
+
+    def __call__(self, url: str, **kwargs):
+        result = self.results[self.calls]
+        self.calls += 1
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+def test_parse_retry_after(clock):
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("") is None
+    assert parse_retry_after("120") == 120
+    assert parse_retry_after("1.5") == 1.5
+    assert parse_retry_after("-5") == 0
+    assert parse_retry_after(email.utils.formatdate(clock.now + 30, usegmt=True)) == 30
+    # dates in the past do not wait
+    assert parse_retry_after(email.utils.formatdate(clock.now - 30, usegmt=True)) == 0
+    assert parse_retry_after("soon") is None
+
+def test_unlimited_requests_do_not_wait(clock):
+    limiter = RateLimiter()
+    for _ in range(100):
+        limiter.acquire()
+    assert clock.sleeps == []
+
+def test_max_requests_per_second_spreads_requests(clock):
+    limiter = RateLimiter(max_requests_per_second=2)
+    start_time = clock.now
+    for _ in range(10):
+        limiter.acquire()
+    # a burst of 4, then one request every half second
+    assert clock.now - start_time == pytest.approx(3.0)
+
+@pytest.mark.parametrize("reset, expected_seconds", [
+    # below EPOCH_THRESHOLD, a number of seconds from now (Bitbucket)
+    ("30", 30),
+    (str(EPOCH_THRESHOLD - 1), EPOCH_THRESHOLD - 1),
+    # above it, an epoch timestamp (Github, Gitlab, Azure DevOps)
+    (str(FakeClock().now + 45), 45),
+    # a reset in the past still waits a second
+    (str(FakeClock().now - 45), 1),
+])
+def test_exhausted_budget_pauses_until_reset(clock, reset, expected_seconds):
+    limiter = RateLimiter()
+    limiter.update_from_headers(CaseInsensitiveDict({"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": reset}))
+    start_time = clock.now
+    limiter.acquire()
+    assert clock.now - start_time == pytest.approx(expected_seconds)
+
+def test_pacing_starts_below_the_reserve(clock):
+    limiter = RateLimiter()
+    # 10% of the limit is 500, so 600 remaining are still sent at full speed
+    limiter.update_from_headers(CaseInsensitiveDict({"X-RateLimit-Limit": "5000", "X-RateLimit-Remaining": "600", "X-RateLimit-Reset": "60"}))
+    assert limiter.get_rate() is None
+    limiter.update_from_headers(CaseInsensitiveDict({"X-RateLimit-Limit": "5000", "X-RateLimit-Remaining": "120", "X-RateLimit-Reset": "60"}))
+    assert limiter.get_rate() == pytest.approx(2.0)
+    # once the window resets and the budget is back above the reserve, pacing stops
+    limiter.update_from_headers(CaseInsensitiveDict({"X-RateLimit-Limit": "5000", "X-RateLimit-Remaining": "5000", "X-RateLimit-Reset": "3600"}))
+    assert limiter.get_rate() is None
+
+def test_pacing_without_a_limit_uses_the_default_reserve(clock):
+    limiter = RateLimiter(max_requests_per_second=10)
+    limiter.update_from_headers(CaseInsensitiveDict({"RateLimit-Remaining": "150", "RateLimit-Reset": "10"}))
+    assert limiter.get_rate() == 10
+    # the lower of the header rate and the configured rate wins
+    limiter.update_from_headers(CaseInsensitiveDict({"RateLimit-Remaining": "50", "RateLimit-Reset": "10"}))
+    assert limiter.get_rate() == pytest.approx(5.0)
+
+def test_retry_after_and_delay_pause_all_callers(clock):
+    limiter = RateLimiter()
+    limiter.update_from_headers(CaseInsensitiveDict({"Retry-After": "7"}))
+    limiter.update_from_headers(CaseInsensitiveDict({"X-RateLimit-Delay": "3"}))
+    start_time = clock.now
+    limiter.acquire()
+    assert clock.now - start_time == pytest.approx(7)
+
+@pytest.mark.parametrize("status_code, headers, throttled", [
+    (200, {}, False),
+    (404, {}, False),
+    (429, {}, True),
+    (502, {}, True),
+    # Github's primary and secondary rate limits
+    (403, {"X-RateLimit-Remaining": "0"}, True),
+    (403, {"Retry-After": "60"}, True),
+    # a plain permission error is not retried
+    (403, {"X-RateLimit-Remaining": "4999"}, False),
+    (403, {}, False),
+])
+def test_is_throttled(status_code, headers, throttled):
+    assert RateLimiter().is_throttled(make_response(status_code, **headers)) == throttled
+
+def test_request_retries_throttled_responses(clock):
+    send = FakeSend(make_response(429, **{"Retry-After": "5"}), make_response(503), make_response(200))
+    limiter = RateLimiter(max_retries=5)
+    assert limiter.request(send, "https://example.com").status_code == 200
+    assert send.calls == 3
+    assert limiter.throttled_responses == 2
+    assert limiter.retries == 2
+
+def test_request_returns_the_last_response_when_retries_are_used_up(clock):
+    send = FakeSend(*[make_response(429) for _ in range(3)])
+    limiter = RateLimiter(max_retries=2)
+    assert limiter.request(send, "https://example.com").status_code == 429
+    assert send.calls == 3
+    # backoff of 1s and 2s with the jitter at its maximum
+    assert clock.sleeps == [1, 2]
+
+def test_request_retries_connection_errors(clock):
+    send = FakeSend(requests.ConnectionError("reset"), make_response(200))
+    assert RateLimiter(max_retries=1).request(send, "https://example.com").status_code == 200
+    send = FakeSend(requests.ConnectionError("reset"), requests.Timeout("timed out"))
+    with pytest.raises(requests.Timeout):
+        RateLimiter(max_retries=1).request(send, "https://example.com")
+    assert send.calls == 2
+
+def test_run_retries_the_given_exceptions(clock):
+    attempts = []
+    def operation():
+        attempts.append(len(attempts))
+        if len(attempts) < 3:
+            raise OSError("clone failed")
+        return "done"
+    limiter = RateLimiter()
+    assert limiter.run(operation, "git clone", (OSError,), max_retries=2) == "done"
+    assert attempts == [0, 1, 2]
+    assert limiter.retries == 2
+
+def test_run_raises_after_max_retries_and_other_exceptions_at_once(clock):
+    attempts = []
+    def operation():
+        attempts.append(len(attempts))
+        raise OSError("clone failed")
+    with pytest.raises(OSError):
+        RateLimiter().run(operation, "git clone", (OSError,), max_retries=1)
+    assert len(attempts) == 2
+    attempts.clear()
+    with pytest.raises(OSError):
+        RateLimiter().run(operation, "git clone", (ValueError,), max_retries=3)
+    assert len(attempts) == 1
@@ -0,0 +1,34 @@
+import os
+from scratch import ScratchSpace, parse_size
+
+def test_parse_size():
+    assert parse_size("512") == 512
+    assert parse_size("500m") == 500 * 1024 ** 2
+    assert parse_size("1.5G") == int(1.5 * 1024 ** 3)
+    assert parse_size("20gb") == 20 * 1024 ** 3
+
+def test_reserve_moves_a_stale_folder_aside(tmp_path):
+    # e.g. left behind when a previous run was killed mid-fetch
+    stale_folder = tmp_path / "repo"
+    os.makedirs(stale_folder / "src")
+    (stale_folder / "src" / "deleted-upstream.py").write_text("x = 1\n")
+    scratch_space = ScratchSpace(str(tmp_path))
+    try:
+        assert scratch_space.reserve("repo", 100) == str(stale_folder)
+        assert not os.path.exists(stale_folder)
+    finally:
+        scratch_space.close()
+    assert os.listdir(tmp_path) == []
+    # the stale folder's delete does not return the new reservation
+    assert scratch_space.reserved_bytes == {"repo": 100}
+
+def test_release_deletes_the_folder_and_returns_the_reservation(tmp_path):
+    scratch_space = ScratchSpace(str(tmp_path), byte_budget=1000)
+    try:
+        folder_path = scratch_space.reserve("repo", 600)
+        os.makedirs(folder_path)
+        scratch_space.release("repo")
+    finally:
+        scratch_space.close()
+    assert os.listdir(tmp_path) == []
+    assert scratch_space.reserved_bytes == {}